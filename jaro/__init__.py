@@ -7,7 +7,9 @@ how closely the strings match. The score ranges from 0 (no match) to 1
 
 Two null strings ('') will compare as equal. Strings should be unicode
 strings, and will be compared as given; the caller is responsible for
-capitalisations and trimming leading/trailing spaces.
+capitalisations and trimming leading/trailing spaces. Both strings may
+instead be bytes, bytearrays or memoryviews of bytes (or of wider codes),
+which are compared code for code without being decoded or copied.
 
 You should normally only need to use either the jaro_metric() or
 jaro_winkler_metric() functions defined here. If you want to implement your
@@ -34,6 +36,17 @@ which expands on Wikipedia's explanation and provided the base of this
 module's tests."""
 from . import jaro
 from . import typo_tables
+from . import process
+from . import index
+from .corpus import Corpus
+# Import the aio, linkage, index_file, np_engine and sweep modules yourself
+# if you need them (e.g. 'from jaro import aio'). They're left out here to
+# keep 'import jaro' quick: asyncio alone, which aio needs, takes longer to
+# import than the rest of the package.
+from .scorer import Scorer
+from .scorer import jaro_scorer, jaro_winkler_scorer, original_scorer
+from .cache import ScoreCache, cached_metric
+from .normalise import Normaliser, normalised_metric
 
 def jaro_metric(string1, string2):
     return jaro.metric_jaro(string1, string2)
@@ -47,16 +60,68 @@ def original_metric(string1, string2):
     return jaro.metric_original(string1, string2)
 setattr(original_metric, '__doc__', jaro.metric_original.__doc__)
 
+def strcmp95_metric(string1, string2, larger_tol=False, to_upper=False):
+    return jaro.metric_strcmp95(string1, string2, larger_tol, to_upper)
+setattr(strcmp95_metric, '__doc__', jaro.metric_strcmp95.__doc__)
+
 def custom_metric(string1, string2, typo_table, typo_scale,
                               boost_threshold, pre_len, pre_scale, longer_prob):
     return jaro.metric_custom(string1, string2, typo_table,
                    typo_scale, boost_threshold, pre_len, pre_scale, longer_prob)
 setattr(custom_metric, '__doc__', jaro.metric_custom.__doc__)
 
+def all_metrics(string1, string2, longer_prob=True):
+    return jaro.metric_all(string1, string2, longer_prob)
+setattr(all_metrics, '__doc__', jaro.metric_all.__doc__)
+
+def jaro_metric_batch(query, choices):
+    return jaro.metric_jaro_batch(query, choices)
+setattr(jaro_metric_batch, '__doc__', jaro.metric_jaro_batch.__doc__)
+
+def jaro_winkler_metric_batch(query, choices):
+    return jaro.metric_jaro_winkler_batch(query, choices)
+setattr(jaro_winkler_metric_batch, '__doc__',
+                                      jaro.metric_jaro_winkler_batch.__doc__)
+
+def original_metric_batch(query, choices):
+    return jaro.metric_original_batch(query, choices)
+setattr(original_metric_batch, '__doc__', jaro.metric_original_batch.__doc__)
+
+def custom_metric_batch(query, choices, typo_table, typo_scale,
+                              boost_threshold, pre_len, pre_scale, longer_prob):
+    return jaro.metric_custom_batch(query, choices, typo_table,
+                   typo_scale, boost_threshold, pre_len, pre_scale, longer_prob)
+setattr(custom_metric_batch, '__doc__', jaro.metric_custom_batch.__doc__)
+
+# Let the functions above stand in for their jaro.py equivalents wherever a
+# metric is passed as an argument (e.g. extract()).
+jaro.metric_params[jaro_metric] = jaro.params_jaro
+jaro.metric_params[jaro_winkler_metric] = jaro.params_jaro_winkler
+jaro.metric_params[original_metric] = jaro.params_original
+
+def extract(query, choices, limit=5, score_cutoff=None,
+                                                  metric=jaro_winkler_metric):
+    return process.extract(query, choices, limit, score_cutoff, metric)
+setattr(extract, '__doc__', process.extract.__doc__)
+
+def cdist(queries, choices, metric=jaro_winkler_metric, score_cutoff=None,
+              dense=True, typecode='d', workers=1, tile_size=256):
+    return process.cdist(queries, choices, metric, score_cutoff, dense,
+                             typecode, workers, tile_size)
+setattr(cdist, '__doc__', process.cdist.__doc__)
+
+def dedupe(strings, threshold, metric=jaro_winkler_metric, blocker=None):
+    return process.dedupe(strings, threshold, metric, blocker)
+setattr(dedupe, '__doc__', process.dedupe.__doc__)
+
 def create_typo_table(typo_chars, score=3):
     return typo_tables.create_typo_table(typo_chars, score)
 setattr(create_typo_table, '__doc__', typo_tables.create_typo_table.__doc__)
 
+def compile_typo_table(typo_table):
+    return typo_tables.compile_typo_table(typo_table)
+setattr(compile_typo_table, '__doc__', typo_tables.compile_typo_table.__doc__)
+
 """
 jaro_metric = jaro.metric_jaro
 # setattr(jaro_metric, '__doc__', jaro.jaro_metric.__doc__)
@@ -0,0 +1,109 @@
+"""
+Asyncio versions of the batch and extract functions.
+
+Scoring a query against a long list of choices takes long enough to stall an
+event loop. The coroutines here split the choices into chunks and score each
+chunk in an executor, so that the loop keeps running in between. They give
+exactly the same answers as their synchronous counterparts.
+
+By default the chunks run on the event loop's default (thread) executor.
+The metrics are pure Python, so threads keep the loop responsive but don't
+spread the work over several CPUs - pass a ProcessPoolExecutor for that.
+
+The number of chunks being scored at once, across all the calls sharing a
+limiter, is capped by an asyncio.Semaphore. Unless one is passed in, each
+event loop gets its own, allowing one chunk per CPU. If a call is cancelled,
+no more of its chunks are started."""
+import asyncio
+import os
+import weakref
+
+from . import jaro
+from . import process
+from .scorer import as_scorer
+
+default_chunk_size = 1000
+
+# One limiter per event loop, as a semaphore can't be shared between loops.
+default_limiters = weakref.WeakKeyDictionary()
+
+def default_limiter():
+    "The semaphore shared by calls on the running loop which aren't given one."
+    loop = asyncio.get_running_loop()
+    try:
+        return default_limiters[loop]
+    except KeyError:
+        limiter = asyncio.Semaphore(os.cpu_count() or 1)
+        default_limiters[loop] = limiter
+        return limiter
+
+def chunked(choices, chunk_size):
+    assert chunk_size > 0
+    choices = list(choices)
+    return [choices[start:start+chunk_size]
+                        for start in range(0, len(choices), chunk_size)]
+
+async def run_chunks(func, args, chunks, executor, limiter):
+    """Call func(*args, chunk) for each of 'chunks' in 'executor', with no
+    more than 'limiter' allows running at once. Returns the list of results."""
+    loop = asyncio.get_running_loop()
+    if limiter is None:
+        limiter = default_limiter()
+
+    async def run(chunk):
+        async with limiter:
+            return await loop.run_in_executor(executor, func,
+                                                          *(args + (chunk,)))
+
+    # gather() cancels all the chunks still waiting if we're cancelled.
+    return await asyncio.gather(*[run(chunk) for chunk in chunks])
+
+async def batch(query, choices, metric=jaro.metric_jaro_winkler,
+                    score_cutoff=None, chunk_size=default_chunk_size,
+                        executor=None, limiter=None):
+    """
+    Score 'query' against every string in 'choices', returning a list of
+    scores, exactly as the metric's batch function would.
+
+    'metric' may be any of the standard metric functions, or a Scorer. The
+    choices are scored 'chunk_size' at a time in 'executor' (the loop's
+    default executor if None), under the asyncio.Semaphore 'limiter'."""
+    results = await run_chunks(batch_chunk,
+                                   (query, score_cutoff, as_scorer(metric)),
+                                       chunked(choices, chunk_size),
+                                           executor, limiter)
+    return [weight for chunk in results for weight in chunk]
+
+# The functions run in the executor. They're defined at module level, so that
+# they can be sent to a ProcessPoolExecutor.
+
+def batch_chunk(query, score_cutoff, scorer, choices):
+    return scorer.batch(query, choices, score_cutoff)
+
+def extract_chunk(query, limit, score_cutoff, metric, choices):
+    return process.extract(query, choices, limit, score_cutoff, metric)
+
+async def extract(query, choices, limit=5, score_cutoff=None,
+                      metric=jaro.metric_jaro_winkler,
+                          chunk_size=default_chunk_size,
+                              executor=None, limiter=None):
+    """
+    Find the choices which best match 'query', returning the same list of
+    (choice, score, index) tuples as process.extract() would.
+
+    The best choices of each chunk are found in 'executor', and then merged;
+    the other arguments are as for batch()."""
+    assert limit is None or limit > 0
+    scorer = as_scorer(metric)
+    chunks = chunked(choices, chunk_size)
+    results = await run_chunks(extract_chunk,
+                                   (query, limit, score_cutoff, scorer),
+                                       chunks, executor, limiter)
+
+    found = []
+    for number, chunk_found in enumerate(results):
+        offset = number * chunk_size
+        found.extend((choice, weight, offset + index)
+                                    for choice, weight, index in chunk_found)
+    found.sort(key=lambda entry: (-entry[1], entry[2]))
+    return found[:limit]
@@ -1,7 +1,11 @@
 from . import compare_strcmp95
 from . import compare_jaro
 from . import jaro_tests
+from . import engine_tests
+from . import process_tests
 
 compare_strcmp95.test()
 compare_jaro.test()
-jaro_tests.test()
\ No newline at end of file
+jaro_tests.test()
+engine_tests.test()
+process_tests.test()
\ No newline at end of file
@@ -0,0 +1,248 @@
+"""
+Benchmark the metrics, and compare the results with an earlier run.
+
+    python -m jaro.bench --output new.json
+    python -m jaro.bench --baseline old.json --output new.json
+
+Each metric is timed over a matrix of string lengths, match ratios
+(identical, near-miss and unrelated strings), alphabets and call styles
+(scoring one pair per call, or a query against a batch of choices). The
+strings are generated from a fixed seed, so runs on different versions of the
+code time exactly the same work. The reference strcmp95() is timed as well,
+for pairs only.
+
+The results are written as JSON, with the pairs scored per second and the
+latency percentiles (in microseconds, per call) for each cell of the matrix.
+Given a baseline, the throughput of each cell is compared with it, and any
+cell more than --tolerance slower is reported as a regression - in which case
+the exit status is 1."""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+from . import jaro
+from . import strcmp95
+from .typo_tables import create_typo_table, compile_typo_table
+
+lengths = [3, 10, 30, 100, 300, 2000]
+ratios = ['identical', 'near_miss', 'unrelated']
+alphabets = {
+    'upper': 'ABCDEFGHIJKLMNOPQRSTUVWXYZ',
+    'mixed': 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz ',
+    'unicode': 'абвгдеёжзийклмнопрстуфхцчшщъыьэюяΑΒΓΔΕΖΗΘαβγδεζηθ中文字符',
+}
+styles = ['single', 'batch']
+
+custom_params = (compile_typo_table(create_typo_table(
+                        ['A', 'E', 'I', 'O', 'M', 'N', 'a', 'e', 'i', 'o'], 5)),
+                 10, 0.7, 4, 0.1, False)
+
+def metric_custom(string1, string2):
+    return jaro.metric_custom(string1, string2, *custom_params)
+
+def metric_custom_batch(query, choices):
+    return jaro.metric_custom_batch(query, choices, *custom_params)
+
+def metric_strcmp95(string1, string2):
+    return strcmp95.strcmp95(string1, string2, debug=False)
+
+# name: (pair function, batch function)
+metrics = {
+    'jaro': (jaro.metric_jaro, jaro.metric_jaro_batch),
+    'jaro_winkler': (jaro.metric_jaro_winkler, jaro.metric_jaro_winkler_batch),
+    'original': (jaro.metric_original, jaro.metric_original_batch),
+    'custom': (metric_custom, metric_custom_batch),
+    'strcmp95': (metric_strcmp95, None),
+}
+
+def num_choices(length, scale=1.0):
+    "How many choices to time for strings of 'length' - fewer for long ones."
+    return max(5, int(min(200, 20000 // length) * scale))
+
+def make_strings(length, ratio, alphabet, count, seed):
+    """Return a query string of 'length' chars of 'alphabet', and 'count'
+    choices which are identical to it, near misses, or unrelated to it."""
+    rand = random.Random('%s-%s-%s-%s' % (seed, length, ratio, alphabet))
+    chars = alphabets[alphabet]
+    def random_string():
+        return ''.join(rand.choice(chars) for i in range(length))
+
+    query = random_string()
+    choices = []
+    for i in range(count):
+        if ratio == 'identical':
+            choice = query
+        elif ratio == 'unrelated':
+            choice = random_string()
+        else:
+            # Change about one char in ten, by substituting a char or
+            # swapping it with its neighbour.
+            choice = list(query)
+            for j in range(max(1, length // 10)):
+                pos = rand.randrange(length)
+                if rand.random() < 0.5 and pos + 1 < length:
+                    choice[pos], choice[pos+1] = choice[pos+1], choice[pos]
+                else:
+                    choice[pos] = rand.choice(chars)
+            choice = ''.join(choice)
+        choices.append(choice)
+    return query, choices
+
+def percentile(times, fraction):
+    times = sorted(times)
+    return times[min(len(times) - 1, int(fraction * len(times)))]
+
+def time_cell(func, style, query, choices, repeat):
+    """Time 'func' on the query and choices, returning the pairs scored per
+    second, and the times taken by each call."""
+    timer = time.perf_counter
+    times = []
+    for i in range(repeat):
+        if style == 'single':
+            for choice in choices:
+                start = timer()
+                func(query, choice)
+                times.append(timer() - start)
+        else:
+            start = timer()
+            func(query, choices)
+            times.append(timer() - start)
+    total = sum(times)
+    pairs = repeat * len(choices)
+    return pairs / total if total else float('inf'), times
+
+def run(metric_names, cell_lengths, cell_ratios, cell_alphabets, cell_styles,
+            repeat=3, scale=1.0, seed=1, progress=None):
+    "Time every cell of the matrix, returning a list of result dicts."
+    results = []
+    for length in cell_lengths:
+        for ratio in cell_ratios:
+            for alphabet in cell_alphabets:
+                query, choices = make_strings(length, ratio, alphabet,
+                                            num_choices(length, scale), seed)
+                for name in metric_names:
+                    for style in cell_styles:
+                        func = metrics[name][style == 'batch']
+                        if func is None: continue
+                        # One untimed call, to warm up any caches.
+                        if style == 'single':
+                            func(query, choices[0])
+                        else:
+                            func(query, choices[:1])
+                        rate, times = time_cell(func, style, query, choices,
+                                                                      repeat)
+                        result = {
+                            'metric': name, 'style': style, 'length': length,
+                            'ratio': ratio, 'alphabet': alphabet,
+                            'pairs': repeat * len(choices),
+                            'pairs_per_sec': rate,
+                            'p50_us': percentile(times, 0.5) * 1e6,
+                            'p90_us': percentile(times, 0.9) * 1e6,
+                            'p99_us': percentile(times, 0.99) * 1e6,
+                        }
+                        results.append(result)
+                        if progress is not None:
+                            progress.write('%-12s %-6s %5d %-9s %-7s '
+                                           '%12.0f pairs/s\n' % (name, style,
+                                               length, ratio, alphabet, rate))
+    return results
+
+def cell_key(result):
+    return (result['metric'], result['style'], result['length'],
+                                        result['ratio'], result['alphabet'])
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Compare the throughput of each cell of 'results' with the same cell of
+    'baseline' (both lists of result dicts, as returned by run()).
+
+    Returns a list of (key, baseline pairs/sec, pairs/sec, ratio) tuples for
+    the cells found in both, and the list of those which are more than
+    'tolerance' (as a fraction) slower."""
+    old = dict((cell_key(result), result) for result in baseline)
+    changes = []
+    regressions = []
+    for result in results:
+        key = cell_key(result)
+        if key not in old: continue
+        old_rate = old[key]['pairs_per_sec']
+        new_rate = result['pairs_per_sec']
+        change = (key, old_rate, new_rate, new_rate / old_rate)
+        changes.append(change)
+        if change[3] < 1 - tolerance:
+            regressions.append(change)
+    return changes, regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m jaro.bench',
+                description='Benchmark the Jaro-Winkler metrics.')
+    parser.add_argument('--metrics', nargs='+', choices=list(metrics),
+                default=list(metrics))
+    parser.add_argument('--lengths', nargs='+', type=int, default=lengths)
+    parser.add_argument('--ratios', nargs='+', choices=ratios, default=ratios)
+    parser.add_argument('--alphabets', nargs='+', choices=list(alphabets),
+                default=list(alphabets))
+    parser.add_argument('--styles', nargs='+', choices=styles, default=styles)
+    parser.add_argument('--repeat', type=int, default=3,
+                help='times to score each cell (default: 3)')
+    parser.add_argument('--scale', type=float, default=1.0,
+                help='multiplier for the number of pairs per cell')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='-',
+                help='file to write the JSON results to (default: stdout)')
+    parser.add_argument('--baseline',
+                help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                help='slowdown reported as a regression (default: 0.1)')
+    parser.add_argument('--quiet', action='store_true',
+                help="don't report progress on stderr")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    progress = None if args.quiet else sys.stderr
+    results = run(args.metrics, args.lengths, args.ratios, args.alphabets,
+                      args.styles, args.repeat, args.scale, args.seed,
+                          progress)
+    report = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'scale': args.scale,
+        'results': results,
+    }
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf8') as f:
+            baseline = json.load(f)['results']
+        changes, regressions = compare(results, baseline, args.tolerance)
+        report['comparison'] = [{'metric': key[0], 'style': key[1],
+                                 'length': key[2], 'ratio': key[3],
+                                 'alphabet': key[4],
+                                 'baseline_pairs_per_sec': old_rate,
+                                 'pairs_per_sec': new_rate,
+                                 'speedup': speedup}
+                                for key, old_rate, new_rate, speedup in changes]
+        for key, old_rate, new_rate, speedup in regressions:
+            sys.stderr.write('Regression: %s %s %d %s %s: %.0f -> %.0f pairs/s'
+                             ' (x%.2f)\n' % (key + (old_rate, new_rate,
+                                                                  speedup)))
+        if regressions:
+            status = 1
+
+    text = json.dumps(report, indent=2)
+    if args.output == '-':
+        sys.stdout.write(text + '\n')
+    else:
+        with open(args.output, 'w', encoding='utf8') as f:
+            f.write(text + '\n')
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+A bounded cache of scores, for traffic which compares the same pairs of
+strings again and again.
+
+string_metrics() always puts the shorter string first, so when the strings'
+lengths differ, the score of a pair doesn't depend on the order they're
+given in. The cache takes advantage of that: (a, b) and (b, a) share an
+entry. Strings of equal length are scored in the order given, which can
+matter [see ScoreCache.score()], so each order has an entry of its own.
+
+Each entry is also tied to the Scorer that calculated it, so different
+metrics (or the same metric with different typo tables) never see each
+other's scores."""
+import collections
+import sys
+import threading
+
+from .scorer import as_scorer
+
+CacheStats = collections.namedtuple('CacheStats',
+                     ['hits', 'misses', 'evictions', 'entries', 'size_bytes'])
+
+# A rough figure for the memory taken by an entry, over and above its
+# strings: the key tuple, the float and the OrderedDict's bookkeeping.
+entry_overhead = 200
+
+class ScoreCache(object):
+    """
+    A thread-safe LRU cache of scores, holding at most 'maxsize' entries and
+    (if given) roughly 'maxbytes' bytes of memory. When either limit is
+    reached, the least recently used entries are thrown out.
+
+    The strings are kept as keys, so they must be hashable: str or bytes.
+    Convert bytearrays and memoryviews with bytes() first."""
+
+    def __init__(self, maxsize=65536, maxbytes=None):
+        assert maxsize is None or maxsize > 0
+        assert maxbytes is None or maxbytes > 0
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        "Throw out all the entries, and reset the statistics."
+        with self.lock:
+            self.entries = collections.OrderedDict()
+            self.size_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        "Return the hits, misses, evictions and current size of the cache."
+        with self.lock:
+            return CacheStats(self.hits, self.misses, self.evictions,
+                                          len(self.entries), self.size_bytes)
+
+    def score(self, metric, string1, string2, score_cutoff=None):
+        """
+        Return the score of 'string1' against 'string2' under 'metric' (a
+        Scorer or standard metric function), from the cache if possible.
+
+        The score is always the one the metric itself gives. Strings of equal
+        length aren't swapped, since a metric's score for them can depend on
+        their order, even with a symmetrical typo table: metric_original()
+        scores ('0L0QAJ', 'Q10QLJ') 0.733, but ('Q10QLJ', '0L0QAJ') 0.771."""
+        for string in (string1, string2):
+            assert isinstance(string, (str, bytes)), \
+                    'ScoreCache strings must be str or bytes, not %s' % (
+                                                        type(string).__name__)
+        scorer = as_scorer(metric)
+        if len(string2) < len(string1):
+            string1, string2 = string2, string1
+        key = (scorer, string1, string2)
+
+        with self.lock:
+            weight = self.entries.get(key)
+            if weight is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        if weight is None:
+            weight = scorer(string1, string2)
+            self.store(key, weight)
+
+        if score_cutoff is not None and weight < score_cutoff: return 0.0
+        return weight
+
+    def store(self, key, weight):
+        size = sys.getsizeof(key[1]) + sys.getsizeof(key[2]) + entry_overhead
+        with self.lock:
+            self.misses += 1
+            if key in self.entries:
+                # Another thread got there first.
+                return
+            self.entries[key] = weight
+            self.size_bytes += size
+            while self.entries and (
+                    (self.maxsize and len(self.entries) > self.maxsize) or
+                    (self.maxbytes and self.size_bytes > self.maxbytes)):
+                old_key, _ = self.entries.popitem(last=False)
+                self.size_bytes -= (sys.getsizeof(old_key[1]) +
+                                    sys.getsizeof(old_key[2]) + entry_overhead)
+                self.evictions += 1
+
+    def cached(self, metric):
+        "Return a version of 'metric' which looks up its scores in this cache."
+        return CachedMetric(self, metric)
+
+class CachedMetric(object):
+    """A metric which keeps its scores in a ScoreCache. Call it just like
+    the metric: metric(string1, string2, score_cutoff=None)."""
+    __slots__ = ('cache', 'scorer')
+
+    def __init__(self, cache, metric):
+        self.cache = cache
+        self.scorer = as_scorer(metric)
+
+    def __call__(self, string1, string2, score_cutoff=None):
+        return self.cache.score(self.scorer, string1, string2, score_cutoff)
+
+    def batch(self, query, choices, score_cutoff=None):
+        "Score 'query' against every string in 'choices', returning a list."
+        score = self.cache.score
+        return [score(self.scorer, query, choice, score_cutoff)
+                                                        for choice in choices]
+
+def cached_metric(metric, maxsize=65536, maxbytes=None):
+    """Return a version of 'metric' (a Scorer or standard metric function)
+    with its own ScoreCache [which see]. The cache is available as the
+    'cache' attribute of the returned function."""
+    return ScoreCache(maxsize, maxbytes).cached(metric)
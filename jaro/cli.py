@@ -0,0 +1,177 @@
+"""
+Score pairs of strings from the command line.
+
+The pairs are read, one per line, as tab (or comma) separated values from a
+file or stdin, and written out to stdout with their scores appended. Input
+is read and scored in chunks, so memory use stays bounded however big the
+input is; with --workers, the chunks are scored in parallel, but still
+written out in the order they were read.
+
+    jaro-winkler --metric original --threshold 0.9 --workers 4 pairs.tsv
+"""
+import argparse
+import collections
+import csv
+import io
+import itertools
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .scorer import Scorer, jaro_scorer, jaro_winkler_scorer, original_scorer
+from .typo_tables import adjwt_compiled
+
+standard_scorers = {
+    'jaro': jaro_scorer,
+    'jaro_winkler': jaro_winkler_scorer,
+    'original': original_scorer,
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='jaro-winkler',
+                description='Score pairs of strings with the Jaro-Winkler '
+                            'metrics.')
+    parser.add_argument('input', nargs='?', default='-',
+                help='file of string pairs, one per line (default: stdin)')
+    parser.add_argument('--format', choices=['tsv', 'csv'], default='tsv',
+                help='format of the input and output (default: tsv)')
+    parser.add_argument('--metric', default='jaro_winkler',
+                choices=sorted(standard_scorers) + ['custom'],
+                help='metric to score the pairs with (default: jaro_winkler)')
+    parser.add_argument('--threshold', type=float, default=None,
+                help='only output pairs scoring at least this much')
+    parser.add_argument('--workers', type=int, default=1,
+                help='number of processes to score with (default: 1)')
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                help='number of pairs to score at a time (default: 1000)')
+
+    custom = parser.add_argument_group('custom metric',
+                'parameters for --metric custom (see metric_custom())')
+    custom.add_argument('--typo-table', choices=['none', 'original'],
+                default='none', help='typo table to use (default: none)')
+    custom.add_argument('--typo-scale', type=float, default=1)
+    custom.add_argument('--boost-threshold', type=float, default=None)
+    custom.add_argument('--pre-len', type=int, default=0)
+    custom.add_argument('--pre-scale', type=float, default=0)
+    custom.add_argument('--longer-prob', action='store_true')
+
+    args = parser.parse_args(argv)
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error('--workers and --chunk-size must be at least 1')
+    if args.metric == 'custom' and args.pre_len * args.pre_scale > 1:
+        # See metric_custom(): the score could be boosted past 1.
+        parser.error('invalid custom metric: --pre-len times --pre-scale '
+                     'must be at most 1')
+    try:
+        args.scorer = make_scorer(args)
+    except AssertionError:
+        parser.error('invalid custom metric: --typo-scale must be above 0, '
+                     '--boost-threshold above 0, --pre-len at least 0 and '
+                     '--pre-scale between 0 and 1')
+    return args
+
+def make_scorer(args):
+    if args.metric != 'custom':
+        return standard_scorers[args.metric]
+    typo_table = adjwt_compiled if args.typo_table == 'original' else None
+    return Scorer(typo_table, args.typo_scale, args.boost_threshold,
+                      args.pre_len, args.pre_scale, args.longer_prob)
+
+def read_pairs(lines, delimiter):
+    "Yield the (string1, string2) pairs from the lines of input."
+    reader = csv.reader(lines, delimiter=delimiter)
+    for row in reader:
+        if not row: continue
+        if len(row) < 2:
+            raise ValueError('line %d: expected two strings, found: %r'
+                                                    % (reader.line_num, row))
+        yield row[0], row[1]
+
+def score_chunk(scorer, pairs, threshold):
+    """Score a list of pairs, returning (string1, string2, score) for those
+    that reach 'threshold'."""
+    scored = []
+    for string1, string2 in pairs:
+        weight = scorer(string1, string2, threshold)
+        if threshold is None or weight >= threshold:
+            scored.append((string1, string2, weight))
+    return scored
+
+def score_pairs(pairs, scorer, threshold=None, workers=1, chunk_size=1000):
+    """
+    Score an iterable of pairs, yielding lists of (string1, string2, score)
+    in the same order as the pairs.
+
+    The pairs are split into chunks of 'chunk_size', which are handed out to
+    'workers' processes. No more than two chunks per worker are read ahead,
+    which keeps memory use bounded."""
+    pairs = iter(pairs)
+    chunks = iter(lambda: list(itertools.islice(pairs, chunk_size)), [])
+
+    if workers <= 1:
+        for chunk in chunks:
+            yield score_chunk(scorer, chunk, threshold)
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(executor.submit(score_chunk, scorer, chunk,
+                                                                  threshold))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def main(argv=None):
+    args = parse_args(argv)
+    delimiter = '\t' if args.format == 'tsv' else ','
+
+    if args.input == '-':
+        # Read the bytes of stdin as the csv module expects, without newline
+        # translation, so that quoted fields can span lines.
+        infile = io.TextIOWrapper(sys.stdin.buffer, encoding='utf8',
+                                                                   newline='')
+    else:
+        infile = open(args.input, newline='', encoding='utf8')
+    writer = csv.writer(sys.stdout, delimiter=delimiter, lineterminator='\n')
+
+    num_read = [0]
+    errors = []
+    def counted(pairs):
+        # A bad line ends the input, but only once the pairs read before it
+        # (in the chunk being filled) have been scored and written out.
+        try:
+            for pair in pairs:
+                num_read[0] += 1
+                yield pair
+        except ValueError as e:
+            errors.append(e)
+
+    num_written = 0
+    start = time.perf_counter()
+    try:
+        pairs = counted(read_pairs(infile, delimiter))
+        for scored in score_pairs(pairs, args.scorer, args.threshold,
+                                      args.workers, args.chunk_size):
+            writer.writerows(scored)
+            num_written += len(scored)
+        if errors:
+            raise errors[0]
+    except ValueError as e:
+        sys.stdout.flush()
+        sys.exit('jaro-winkler: error: %s' % e)
+    finally:
+        if args.input == '-':
+            # Leave sys.stdin open.
+            infile.detach()
+        else:
+            infile.close()
+    elapsed = time.perf_counter() - start
+
+    rate = num_read[0] / elapsed if elapsed else 0.0
+    sys.stderr.write('Scored %d pairs in %.2fs (%.0f pairs/s); wrote %d.\n' %
+                                    (num_read[0], elapsed, rate, num_written))
+
+if __name__ == '__main__':
+    main()
@@ -3,39 +3,8 @@ import sys
 from . import jaro
 from . import strcmp95
 
-from .typo_tables import adjwt
 from .jaro_tests import gen_test_args, jaro_tests
-from .jaro import fn_jaro, fn_winkler, fn_longer, string_metrics
-
-def all_metrics(string1, string2, longer_prob):
-
-    pre_scale = 0.1
-    typo_scale = 10
-
-    ans = string_metrics(string1, string2,
-                            boost_threshold=0.7, pre_len=4,
-                               typo_table=adjwt, typo_scale=typo_scale,
-                                  pre_scale=pre_scale, longer_prob=longer_prob)
-
-    (len1, len2, num_matches, half_transposes,
-                                     typo_score, pre_matches, adjust_long) = ans
-    assert not (longer_prob or adjust_long) or longer_prob
-
-    weight_jaro = fn_jaro(len1, len2, num_matches, half_transposes, 0, 1)
-    weight_typo = fn_jaro(len1, len2, num_matches, half_transposes,
-                                                         typo_score, typo_scale)
-    weight_winkler = fn_winkler(weight_jaro, pre_matches, pre_scale)
-    weight_winkler_typo = fn_winkler(weight_typo, pre_matches, pre_scale)
-    weight_longer = weight_winkler_typo
-
-    if adjust_long:
-        weight_longer = fn_longer(weight_longer, len1, len2,
-                                                       num_matches, pre_matches)
-
-    return (len1, len2, num_matches, half_transposes,
-                typo_score, pre_matches, adjust_long,
-                    weight_jaro, weight_typo, weight_winkler,
-                        weight_winkler_typo, weight_longer)
+from .jaro import metric_all as all_metrics
 
 def compare(string1, string2, larger_tol):
 
@@ -48,6 +17,14 @@ def compare(string1, string2, larger_tol):
 
     weights = ans2[-5:]
 
+    # strcmp95 gives weight_winkler the prefix boost whenever the weight with
+    # typos passes 0.7, but metric_all() (like metric_jaro_winkler()) only
+    # when the weight without them does. They're checked separately, below.
+    winkler = ans2._fields.index('weight_winkler')
+    ref_winkler = ans1[winkler]
+    ans1 = ans1[:winkler] + ans1[winkler+1:]
+    ans2 = ans2[:winkler] + ans2[winkler+1:]
+
     rearrange = ans1[:2]!=ans2[:2] and ans1[0]==ans2[1] and ans1[1]==ans2[0]
     check = ((rearrange and ans1[2:] == ans2[2:]) or
                                            (not rearrange and ans1 == ans2))
@@ -63,6 +40,11 @@ def compare(string1, string2, larger_tol):
 
     (weight_jaro, weight_typo, weight_winkler,
                                    weight_winkler_typo, weight_longer) = weights
+    pre_matches = ans2[5]
+
+    boosted = jaro.fn_winkler(weight_jaro, pre_matches, 0.1)
+    assert ref_winkler == (boosted if weight_typo > 0.7 else weight_jaro)
+    assert weight_winkler == (boosted if weight_jaro > 0.7 else weight_jaro)
 
     assert weight_jaro == jaro.metric_jaro(s1, s2)
     assert weight_winkler == jaro.metric_jaro_winkler(s1, s2)
@@ -73,9 +55,30 @@ def compare(string1, string2, larger_tol):
     else:
         assert weight_longer == weight_winkler_typo
 
+def compare_strcmp95(string1, string2, larger_tol, to_upper):
+
+    # metric_strcmp95() needs no trimming, and uses the flags just as
+    # strcmp95 does - in either order.
+    for s1, s2 in [(string1, string2), (string2, string1),
+                   (' %s  ' % string1, string2)]:
+        ans = strcmp95.strcmp95(s1, s2, larger_tol, to_upper, debug=0)
+        assert jaro.metric_strcmp95(s1, s2, larger_tol, to_upper) == ans[-1]
+
+# Pairs where only the weight with typos passes the boost threshold, so that
+# strcmp95's weight_winkler differs from metric_jaro_winkler().
+typo_boost_pairs = [('IOTESE', 'ITIIMSI'), ('NANNIB', 'NAOMENM')]
+
 def test():
     for larger_tol, to_upper, s1, s2 in gen_test_args(jaro_tests):
         compare(s1, s2, larger_tol)
+        compare_strcmp95(s1, s2, larger_tol, to_upper)
+
+    for s1, s2 in typo_boost_pairs:
+        ans = all_metrics(s1, s2)
+        assert ans.weight_jaro <= 0.7 < ans.weight_typo and ans.pre_matches
+        assert strcmp95.strcmp95(s1, s2, debug=0)[9] != ans.weight_winkler
+        for larger_tol in [False, True]:
+            compare(s1, s2, larger_tol)
 
 if __name__ == '__main__':
     test()
\ No newline at end of file
@@ -0,0 +1,220 @@
+"""
+A compact store for a large list of choice strings.
+
+A list of millions of short strings costs far more in per-object overhead
+than in the chars themselves. A Corpus keeps all of its strings end to end in
+one array of code units - bytes, if every char fits, or 16 or 32 bit codes
+if not - with an array of offsets marking where each string starts. The
+lengths (and prefixes) of the strings come straight from the offsets and the
+buffer. The signatures of the strings [see jaro.signature()] can optionally
+be kept as well, packed into another pair of arrays.
+
+Queries score slices of the buffer directly, as memoryviews [see the notes
+on byte strings in jaro.py], so no str is made for a choice unless it's
+returned. They give exactly the same scores as a list of the strings would.
+
+A Corpus pickles as its arrays, cheaply, and so can be passed to other
+processes."""
+import array
+import sys
+
+from . import jaro
+from . import process
+from .scorer import as_scorer
+
+# The typecodes of the buffer, narrowest first, with the largest code each
+# can hold.
+wide_typecode = 'I' if array.array('I').itemsize >= 4 else 'L'
+typecodes = [('B', 0xff), ('H', 0xffff), (wide_typecode, sys.maxunicode)]
+
+# How to turn strings into each width of code unit, in the machine's order.
+encodings = {1: 'latin-1', 2: 'utf-16-' + sys.byteorder[0] + 'e',
+             4: 'utf-32-' + sys.byteorder[0] + 'e'}
+
+signature_bytes = jaro.signature_buckets * jaro.signature_depth // 8
+
+def code_typecode(code):
+    "The narrowest typecode which holds the code 'code'."
+    for typecode, top in typecodes:
+        if code <= top:
+            return typecode
+
+def encode(string, typecode):
+    "Return the bytes of the codes of 'string', as units of 'typecode'."
+    # Surrogates can't be encoded, but they're code points like any other.
+    return string.encode(encodings[array.array(typecode).itemsize],
+                                                              'surrogatepass')
+
+def to_codes(string):
+    """Return 'string' as a sequence of its codes, to be scored against the
+    choices of a Corpus: as bytes, if it can be, or else a memoryview."""
+    if isinstance(string, str):
+        typecode = code_typecode(ord(max(string)) if string else 0)
+        if typecode == 'B':
+            return string.encode('latin-1')
+        string = memoryview(array.array(typecode, encode(string, typecode)))
+    return string
+
+class Signatures(object):
+    """The signatures of the strings of a Corpus, as a read-only sequence:
+    'bits' holds the bits of each, as 'signature_bytes' little-endian bytes,
+    and 'excess' their excesses."""
+    __slots__ = ('bits', 'excess')
+
+    def __init__(self, bits, excess):
+        self.bits = bits
+        self.excess = excess
+
+    def __len__(self):
+        return len(self.excess)
+
+    def __getitem__(self, index):
+        start = index * signature_bytes
+        return (int.from_bytes(self.bits[start:start+signature_bytes],
+                                            'little'), self.excess[index])
+
+class Corpus(object):
+    """
+    A list of strings, stored compactly.
+
+    Build one from an iterable of strings, and add more with append() or
+    extend(). If 'signatures' is true, the signatures of the strings are
+    kept too, and used to rule out choices in threshold and top-k queries.
+
+    Indexing a Corpus, or iterating over it, gives the strings as str; view()
+    gives a string as a memoryview of its codes, without copying it. Don't
+    add strings while holding on to views, as an array can't grow while
+    they're in use.
+
+    'buffer' is the array of codes, of type 'typecode', and 'offsets' the
+    array of the positions in it where each string starts (and, at the end,
+    where the last one finishes). They (and the arrays of signatures) may
+    instead be read-only memoryviews, as for a Corpus mapped from a file."""
+
+    def __init__(self, strings=(), signatures=False):
+        self.typecode = 'B'
+        self.buffer = array.array('B')
+        self.offsets = array.array('Q', [0])
+        self.signature_bits = None
+        self.signature_excess = None
+        if signatures:
+            self.signature_bits = array.array('B')
+            self.signature_excess = array.array('I')
+        self.extend(strings)
+
+    @classmethod
+    def from_arrays(cls, typecode, buffer, offsets, signature_bits=None,
+                                                      signature_excess=None):
+        "Make a Corpus from its arrays (or memoryviews), without copying them."
+        corpus = cls.__new__(cls)
+        corpus.__setstate__((typecode, buffer, offsets, signature_bits,
+                                                           signature_excess))
+        return corpus
+
+    def widen(self, typecode):
+        "Make the buffer of type 'typecode', copying the codes into it."
+        self.buffer = array.array(typecode, self.buffer)
+        self.typecode = typecode
+
+    def append(self, string):
+        assert isinstance(string, str)
+        if string:
+            typecode = code_typecode(ord(max(string)))
+            if array.array(typecode).itemsize > self.buffer.itemsize:
+                self.widen(typecode)
+        self.buffer.frombytes(encode(string, self.typecode))
+        self.offsets.append(len(self.buffer))
+        if self.signature_bits is not None:
+            bits, excess = jaro.signature(string)
+            self.signature_bits.frombytes(bits.to_bytes(signature_bytes,
+                                                                    'little'))
+            self.signature_excess.append(excess)
+
+    def extend(self, strings):
+        for string in strings:
+            self.append(string)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def length(self, index):
+        "The length of string 'index'."
+        return self.offsets[index+1] - self.offsets[index]
+
+    def view(self, index):
+        "String 'index', as a memoryview of its codes."
+        if index < 0:
+            index += len(self)
+        return memoryview(self.buffer)[self.offsets[index]:
+                                                        self.offsets[index+1]]
+
+    def views(self):
+        "Iterate over the strings, as memoryviews of their codes."
+        memory = memoryview(self.buffer)
+        offsets = self.offsets
+        for index in range(len(self)):
+            yield memory[offsets[index]:offsets[index+1]]
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError('Corpus index out of range')
+        view = self.view(index)
+        return view.tobytes().decode(encodings[view.itemsize], 'surrogatepass')
+
+    def __iter__(self):
+        encoding = encodings[memoryview(self.buffer).itemsize]
+        for view in self.views():
+            yield view.tobytes().decode(encoding, 'surrogatepass')
+
+    @property
+    def signatures(self):
+        "The Signatures of the strings, or None if they weren't kept."
+        if self.signature_bits is None:
+            return None
+        return Signatures(self.signature_bits, self.signature_excess)
+
+    def size_bytes(self):
+        "The memory taken by the arrays of the Corpus, in bytes."
+        size = 0
+        for data in [self.buffer, self.offsets, self.signature_bits,
+                                                     self.signature_excess]:
+            if data is not None:
+                size += memoryview(data).nbytes
+        return size
+
+    def batch(self, query, metric=jaro.metric_jaro_winkler, score_cutoff=None):
+        """Score 'query' against every string, returning a list of scores,
+        exactly as the metric's batch function would."""
+        return as_scorer(metric).batch(to_codes(query), self.views(),
+                                                                 score_cutoff)
+
+    def extract(self, query, limit=5, score_cutoff=None,
+                                               metric=jaro.metric_jaro_winkler):
+        """Find the strings which best match 'query', returning exactly what
+        process.extract() would for the list of strings."""
+        found = process.extract(to_codes(query), self.views(), limit,
+                                    score_cutoff, metric, self.signatures)
+        return [(self[index], weight, index) for view, weight, index in found]
+
+    def search(self, query, threshold, metric=jaro.metric_jaro_winkler):
+        """Find every string scoring at least 'threshold' against 'query',
+        best first, as (string, score, index) tuples."""
+        return self.extract(query, None, threshold, metric)
+
+    def __getstate__(self):
+        # Memoryviews can't be pickled, so they're copied into arrays.
+        state = [self.typecode]
+        for data in [self.buffer, self.offsets, self.signature_bits,
+                                                     self.signature_excess]:
+            if isinstance(data, memoryview):
+                data = array.array(data.format, data.tobytes())
+            state.append(data)
+        return tuple(state)
+
+    def __setstate__(self, state):
+        (self.typecode, self.buffer, self.offsets, self.signature_bits,
+                                                 self.signature_excess) = state
+
+    def __repr__(self):
+        return '<Corpus of %d strings, %d bytes>' % (len(self),
+                                                             self.size_bytes())
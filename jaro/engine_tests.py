@@ -0,0 +1,416 @@
+import array
+import pickle
+import random
+
+from . import jaro
+from .typo_tables import create_typo_table
+from .jaro_tests import gen_test_args, jaro_tests
+
+# The faster code paths in jaro.py must give exactly the same numbers as the
+# straightforward, per-pair metric functions. We check them against each
+# other on the LingPipe test cases, and on a batch of random strings chosen to
+# have plenty of matches, transpositions and typos between them.
+
+alphabets = ['ABCEIO', 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0158 ', 'abcABC ',
+             'абвАБ']
+
+def random_strings(num, seed=1, max_len=12):
+    rand = random.Random(seed)
+    strings = []
+    for i in range(num):
+        alphabet = rand.choice(alphabets)
+        length = rand.randint(0, max_len)
+        strings.append(''.join(rand.choice(alphabet) for j in range(length)))
+    return strings
+
+def random_pairs(num, seed=1, max_len=12):
+    strings = random_strings(2*num, seed, max_len)
+    pairs = list(zip(strings[::2], strings[1::2]))
+    # Make sure we also get near-misses, not just unrelated strings.
+    rand = random.Random(seed)
+    for s1, s2 in list(pairs):
+        if len(s1) > 1:
+            i = rand.randrange(len(s1) - 1)
+            pairs.append((s1, s1[:i] + s1[i+1] + s1[i] + s1[i+2:]))
+    return pairs
+
+def test_pairs():
+    pairs = [tuple(t[:2]) for t in jaro_tests]
+    pairs.extend((s1, s2) for _, _, s1, s2 in gen_test_args(jaro_tests))
+    pairs.extend(random_pairs(500))
+    return pairs
+
+metrics = [
+    (jaro.metric_jaro, jaro.metric_jaro_batch, jaro.params_jaro),
+    (jaro.metric_jaro_winkler, jaro.metric_jaro_winkler_batch,
+                                                     jaro.params_jaro_winkler),
+    (jaro.metric_original, jaro.metric_original_batch, jaro.params_original),
+]
+
+def test_batch():
+    pairs = test_pairs()
+    queries = sorted(set(s1 for s1, s2 in pairs))[:40]
+    choices = [s2 for s1, s2 in pairs]
+
+    for metric, metric_batch, params in metrics:
+        for query in queries:
+            expected = [metric(query, choice) for choice in choices]
+            assert metric_batch(query, choices) == expected
+            assert metric_batch(query, iter(choices)) == expected
+            assert jaro.metric_custom_batch(query, choices, *params) == expected
+            custom = [jaro.metric_custom(query, c, *params) for c in choices]
+            assert custom == expected
+
+cutoffs = [None, 0.0, 0.3, 0.7, 0.8, 0.88, 0.95, 1.0]
+
+# Typo tables worth a little, a lot, and as much as a matching char.
+typo_table3 = create_typo_table(['A', 'E', 'B', '8', 'I', 'L'], 3)
+typo_table9 = create_typo_table(['A', 'E', 'B', '8', 'O', '0'], 9)
+custom_params = [
+    (typo_table3, 10, 0.7, 4, 0.1, True),
+    (typo_table3, 5, 0.5, 3, 0.2, True),
+    (typo_table9, 10, None, 0, 0, False),
+    (typo_table3, 3, 0.5, 3, 0.2, True),
+    (None, 1, 0.9, 10, 0.1, False),
+]
+
+def test_cutoff():
+    pairs = test_pairs()
+    for metric, metric_batch, params in metrics:
+        for s1, s2 in pairs:
+            weight = metric(s1, s2)
+            for cutoff in cutoffs:
+                expected = weight
+                if cutoff is not None and weight < cutoff: expected = 0.0
+                assert metric(s1, s2, cutoff) == expected, (s1, s2, cutoff)
+
+    for params in custom_params:
+        for s1, s2 in pairs:
+            weight = jaro.metric_custom(s1, s2, *params)
+            for cutoff in cutoffs:
+                expected = weight
+                if cutoff is not None and weight < cutoff: expected = 0.0
+                found = jaro.metric_custom(s1, s2, *(params + (cutoff,)))
+                assert found == expected, (s1, s2, params, cutoff)
+
+def test_min_matches():
+    for params in list(jaro.metric_params.values()) + custom_params:
+        typo_table, typo_scale = params[:2]
+        typo_max = jaro.max_typo_score(typo_table)
+        for len2 in range(1, 30):
+            for len1 in range(1, len2 + 1):
+                for cutoff in cutoffs[1:]:
+                    min_matches = jaro.fn_min_matches(len1, len2, typo_max,
+                                                     *(params[1:] + (cutoff,)))
+                    for matches in range(1, min(min_matches, len1 + 1)):
+                        typo_bound = (len1 - matches) * typo_max / typo_scale
+                        bound = jaro.fn_bound(len1, len2, matches, 0,
+                                                    typo_bound, *params[2:])
+                        assert bound < cutoff
+
+def ordered_pairs(pairs):
+    "Drop pairs with null strings, and put the shorter string first."
+    for s1, s2 in pairs:
+        if s1 and s2:
+            if len(s2) < len(s1): s1, s2 = s2, s1
+            yield s1, s2, len(s1), len(s2)
+
+def test_bits():
+    pairs = test_pairs() + random_pairs(100, seed=5, max_len=150)
+    for s1, s2, len1, len2 in ordered_pairs(pairs):
+        num_matches, flags1, flags2 = jaro.count_matches(s1, s2, len1, len2)
+        half_transposes = jaro.count_half_transpositions(s1, s2,
+                                                               flags1, flags2)
+        ans = jaro.count_matches_bits(s1, s2, len1, len2)
+        assert ans[0] == num_matches
+        assert jaro.bits_to_flags(ans[1], len1) == flags1
+        assert jaro.bits_to_flags(ans[2], len2) == flags2
+        assert jaro.count_half_transpositions_bits(s1, s2, *ans[1:]) == \
+                                                                half_transposes
+
+        # Both give up when asked for one more match than there is (which
+        # they can only know if there were any misses).
+        for min_matches in [num_matches, num_matches + 1]:
+            expected = num_matches
+            if min_matches > num_matches and num_matches < len1:
+                expected = 0
+            ref = jaro.count_matches(s1, s2, len1, len2, min_matches)[0]
+            ans = jaro.count_matches_bits(s1, s2, len1, len2, min_matches)[0]
+            assert ref == ans == expected
+
+def long_pairs(num, seed=6):
+    "Pairs of longer strings, with a sprinkling of differences between them."
+    rand = random.Random(seed)
+    pairs = []
+    for i in range(num):
+        alphabet = rand.choice(alphabets)
+        length = rand.randint(50, 400)
+        s1 = [rand.choice(alphabet) for j in range(length)]
+        s2 = list(s1)
+        for j in range(rand.randint(0, length // 4)):
+            k = rand.randrange(len(s2))
+            action = rand.randint(0, 2)
+            if action == 0: s2[k] = rand.choice(alphabet)
+            elif action == 1: del s2[k]
+            else: s2.insert(k, rand.choice(alphabet))
+        pairs.append((''.join(s1), ''.join(s2)))
+    return pairs
+
+def test_long():
+    pairs = test_pairs() + long_pairs(60)
+    for s1, s2, len1, len2 in ordered_pairs(pairs):
+        expected = jaro.count_matches(s1, s2, len1, len2)
+        assert jaro.count_matches_long(s1, s2, len1, len2) == expected
+        num_matches, flags1, flags2 = expected
+        if num_matches == len1: continue
+        for typo_table in [jaro.adjwt, typo_table3, typo_table9]:
+            ans1 = jaro.count_typos(s1, s2, flags1, list(flags2), typo_table)
+            ans2 = jaro.count_typos_long(s1, s2, flags1, list(flags2),
+                                                                    typo_table)
+            assert ans1 == ans2
+
+    # Whichever engine the metrics use, the answers must be the same.
+    long_threshold = jaro.long_threshold
+    try:
+        scores = []
+        for jaro.long_threshold in [0, 10**6]:
+            scores.append([metric(s1, s2) for s1, s2 in pairs
+                                       for metric, _, _ in metrics])
+        assert scores[0] == scores[1]
+    finally:
+        jaro.long_threshold = long_threshold
+
+def test_compiled():
+    from . import strcmp95
+    from .typo_tables import compile_typo_table, adjwt_compiled
+
+    # Both forms of the original table compile to the same thing.
+    assert compile_typo_table(strcmp95.adjwt).rows == adjwt_compiled.rows
+    assert adjwt_compiled.rows == jaro.adjwt
+    assert adjwt_compiled.max_score == 3
+    assert pickle.loads(pickle.dumps(adjwt_compiled)).rows == jaro.adjwt
+
+    tables = [jaro.adjwt, typo_table3, typo_table9]
+    tables += [compile_typo_table(table) for table in tables]
+    pairs = test_pairs() + long_pairs(20)
+    for s1, s2, len1, len2 in ordered_pairs(pairs):
+        num_matches, flags1, flags2 = jaro.count_matches(s1, s2, len1, len2)
+        if num_matches == len1: continue
+        bits1 = sum(flag << i for i, flag in enumerate(flags1))
+        bits2 = sum(flag << j for j, flag in enumerate(flags2))
+        for typo_table in tables:
+            typo_score, typo_flags = jaro.count_typos(s1, s2, flags1,
+                                                    list(flags2), typo_table)
+            ans = jaro.count_typos_long(s1, s2, flags1, list(flags2),
+                                                                    typo_table)
+            assert ans == (typo_score, typo_flags)
+            ans = jaro.count_typos_bits(s1, s2, bits1, bits2, typo_table)
+            assert ans[0] == typo_score
+            assert jaro.bits_to_flags(ans[1], len2) == [int(bool(flag))
+                                                        for flag in typo_flags]
+
+    for params in custom_params:
+        if params[0] is None: continue
+        compiled_params = (compile_typo_table(params[0]),) + params[1:]
+        for s1, s2 in pairs:
+            assert jaro.metric_custom(s1, s2, *params) == \
+                                    jaro.metric_custom(s1, s2, *compiled_params)
+
+def test_scorer():
+    from .scorer import Scorer, as_scorer
+    from .scorer import jaro_scorer, jaro_winkler_scorer, original_scorer
+
+    pairs = test_pairs()
+    standard = [jaro_scorer, jaro_winkler_scorer, original_scorer]
+    for scorer, (metric, metric_batch, params) in zip(standard, metrics):
+        assert as_scorer(metric) is scorer
+        assert pickle.loads(pickle.dumps(scorer)) is scorer
+        for s1, s2 in pairs:
+            assert scorer(s1, s2) == metric(s1, s2)
+            assert scorer(s1, s2, 0.8) == metric(s1, s2, 0.8)
+        choices = [s2 for s1, s2 in pairs]
+        assert scorer.batch('MARTHA', choices) == \
+                                            metric_batch('MARTHA', choices)
+
+    for params in custom_params:
+        scorer = Scorer(*params)
+        copy = pickle.loads(pickle.dumps(scorer))
+        for s1, s2 in pairs:
+            expected = jaro.metric_custom(s1, s2, *params)
+            assert scorer(s1, s2) == copy(s1, s2) == expected
+        choices = [s2 for s1, s2 in pairs]
+        assert scorer.batch('MARTHA', choices, 0.8) == \
+              [jaro.metric_custom('MARTHA', c, *(params + (0.8,)))
+                                                             for c in choices]
+
+def test_all_metrics():
+    for s1, s2 in test_pairs() + long_pairs(10):
+        ans = jaro.metric_all(s1, s2)
+        assert ans.weight_jaro == jaro.metric_jaro(s1, s2)
+        assert ans.weight_winkler == jaro.metric_jaro_winkler(s1, s2)
+        assert ans.weight_longer == jaro.metric_original(s1, s2)
+        assert ans[:7] == jaro.string_metrics(s1, s2, *jaro.params_original)
+
+        ans = jaro.metric_all(s1, s2, longer_prob=False)
+        params = jaro.params_original[:-1] + (False,)
+        assert ans.weight_longer == ans.weight_winkler_typo == \
+                                            jaro.metric_custom(s1, s2, *params)
+
+def test_stats():
+    pairs = test_pairs() + long_pairs(10)
+    assert jaro.stats is None
+    expected = [jaro.metric_original(s1, s2, 0.8) for s1, s2 in pairs]
+
+    with jaro.collect_stats() as stats:
+        found = [jaro.metric_original(s1, s2, 0.8) for s1, s2 in pairs]
+        found_batch = jaro.metric_jaro_batch('', ['', 'a'])
+    assert jaro.stats is None
+    assert found == expected
+    assert found_batch == [1.0, 0.0]
+
+    counts = stats.snapshot()
+    assert counts['pairs'] == len(pairs) + 2
+    assert counts['empty'] == sum(1 for s1, s2 in pairs if not (s1 and s2)) + 2
+    assert counts['early_exits'] > 0 and counts['no_matches'] > 0
+    assert counts['typo_scans'] > 0
+    assert counts['early_exits'] + counts['empty'] + counts['no_matches'] \
+                                                        <= counts['pairs']
+    for name in ['matches_time', 'transpositions_time', 'typos_time',
+                                                            'adjust_time']:
+        assert counts[name] > 0
+
+    # Stats can be collected into an existing object, and nest.
+    outer = jaro.enable_stats()
+    with jaro.collect_stats(stats) as inner:
+        assert inner is stats
+        jaro.metric_jaro('MARTHA', 'MARHTA')
+    assert jaro.stats is outer
+    jaro.metric_jaro('MARTHA', 'MARHTA')
+    assert jaro.disable_stats() is outer
+    assert stats.pairs == counts['pairs'] + 1
+    assert outer.pairs == 1
+
+    stats.reset()
+    assert set(stats.snapshot().values()) == {0}
+
+def test_strcmp95():
+    from . import strcmp95
+    # Random pairs (in both orders, so the longer string comes first half the
+    # time), with spaces around them, and long enough for both engines.
+    pairs = random_pairs(300, seed=7) + long_pairs(10)
+    pairs += [(s2, ' %s ' % s1) for s1, s2 in pairs]
+    for s1, s2 in pairs:
+        for larger_tol in [False, True]:
+            for to_upper in [False, True]:
+                ans = strcmp95.strcmp95(s1, s2, larger_tol, to_upper,
+                                                                 debug=False)
+                assert jaro.metric_strcmp95(s1, s2, larger_tol, to_upper) \
+                                                    == ans[-1], (s1, s2)
+
+def test_bytes():
+    from .scorer import Scorer
+    # Byte strings score just as the str of the same chars would.
+    pairs = [(s1, s2) for s1, s2 in test_pairs() + long_pairs(10)
+                if max(s1 + s2 + ' ') < '\u0100']
+    typo_table = create_typo_table(['A', 'E', 'I', 'O', 'a', 'e', 'i'], 5)
+    custom = (typo_table, 10, 0.7, 4, 0.1, True)
+    scorer = Scorer(*custom)
+    for s1, s2 in pairs:
+        b1 = s1.encode('latin-1')
+        b2 = s2.encode('latin-1')
+        for t1, t2 in [(b1, b2), (bytearray(b1), memoryview(b2)),
+                                            (memoryview(b1), bytearray(b2))]:
+            for metric in jaro.metric_params:
+                assert metric(t1, t2) == metric(s1, s2), (metric, s1, s2)
+            assert jaro.metric_custom(t1, t2, *custom) == \
+                            jaro.metric_custom(s1, s2, *custom), (s1, s2)
+            assert scorer(t1, t2, 0.8) == scorer(s1, s2, 0.8)
+            assert jaro.metric_all(t1, t2) == jaro.metric_all(s1, s2)
+
+    strings = [s2 for s1, s2 in pairs]
+    byte_strings = [memoryview(s.encode('latin-1')) for s in strings]
+    for query in ['MARTHA', 'abc', '']:
+        byte_query = query.encode('latin-1')
+        assert jaro.metric_original_batch(byte_query, byte_strings) == \
+               jaro.metric_original_batch(query, strings)
+        assert scorer.batch(byte_query, byte_strings) == \
+               scorer.batch(query, strings)
+        found = scorer.extract(byte_query, byte_strings, 10)
+        assert [(index, weight) for choice, weight, index in found] == \
+               [(index, weight) for choice, weight, index in
+                                          scorer.extract(query, strings, 10)]
+
+    # A table already keyed by code is its own version for bytes, even once
+    # it's been pickled (as it is on its way to another process) or compiled
+    # again.
+    from .typo_tables import TypoTable, adjwt_compiled, bytes_typo_table
+    bytes_table = bytes_typo_table(adjwt_compiled)
+    expected = jaro.metric_original('MARTHA', 'MARHTA')
+    for table in [bytes_table, pickle.loads(pickle.dumps(bytes_table)),
+                                                    TypoTable(bytes_table)]:
+        assert bytes_typo_table(table) is table
+        original = Scorer(table, 10, 0.7, 4, 0.1, True)
+        for scorer_copy in [original, pickle.loads(pickle.dumps(original))]:
+            assert scorer_copy(b'MARTHA', b'MARHTA') == expected
+
+    # Wider codes score as the str of those code points would.
+    for s1, s2 in pairs + [('абв', 'бaв'), ('\U0001f600ab', 'a\U0001f600b')]:
+        c1 = memoryview(array.array('I', map(ord, s1)))
+        c2 = memoryview(array.array('H' if max(s2 + ' ') < '\uffff' else 'I',
+                                                              map(ord, s2)))
+        assert scorer(c1, c2) == scorer(s1, s2)
+        assert jaro.metric_original(c2, c1) == jaro.metric_original(s2, s1)
+
+    # But a str can't be compared with bytes, nor bytes with floats.
+    for s1, s2 in [('abc', b'abc'), (b'abc', 'abc'),
+                                    (b'ab', memoryview(b'abcdefgh').cast('d'))]:
+        for func in [jaro.metric_jaro, scorer]:
+            try:
+                func(s1, s2)
+            except AssertionError:
+                pass
+            else:
+                assert False, (func, s1, s2)
+    try:
+        jaro.metric_jaro_batch('abc', [b'abc'])
+    except AssertionError:
+        pass
+    else:
+        assert False
+
+def test_signature():
+    # The signatures must never bound the matches below the true count, and
+    # the scores with them must be the same as without.
+    pairs = test_pairs() + long_pairs(10) + [('A' * 150, 'A' * 120 + 'B')]
+    tight = 0
+    for s1, s2 in pairs:
+        if len(s2) < len(s1):
+            s1, s2 = s2, s1
+        bound = jaro.signature_matches(jaro.signature(s1), jaro.signature(s2))
+        if s1:
+            assert jaro.count_matches(s1, s2, len(s1), len(s2))[0] <= bound
+            tight += bound < len(s1)
+        score = jaro.query_scorer(s1, *jaro.params_original)
+        for cutoff in [None, 0.5, 0.8, 0.95]:
+            assert score(s2, cutoff, jaro.signature(s2)) == \
+                                    jaro.metric_original(s1, s2, cutoff)
+    assert tight > len(pairs) / 2
+    assert jaro.signature('Ab') == jaro.signature(b'bA')
+    assert jaro.signature('AAAAAA') == (jaro.signature_fill[4] << 1, 2)
+
+def test():
+    test_batch()
+    test_bits()
+    test_long()
+    test_compiled()
+    test_scorer()
+    test_all_metrics()
+    test_cutoff()
+    test_min_matches()
+    test_stats()
+    test_strcmp95()
+    test_bytes()
+    test_signature()
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,155 @@
+"""
+An index of choice strings, grouped by length, for threshold and top-k
+queries.
+
+However alike two strings are, the lengths alone put a ceiling on their
+score [see fn_length_bound()]: a four letter query can't score 0.9 against a
+twelve letter choice under any of the metrics. The ceiling only falls as the
+lengths move further apart, so a query need only look at the lengths either
+side of its own, up to the first which can't reach the threshold. Every
+choice of the other lengths is ruled out without being looked at.
+
+Optionally, the index also keeps the signature() of each choice, a sketch of
+its chars. That bounds the number of chars it can have in common with a query
+[see signature_matches()], and rules out most of the choices which share too
+few chars with it, before any matching is done.
+
+The index doesn't depend on the metric, so one index serves queries under
+any metric (and threshold)."""
+import array
+import bisect
+import heapq
+
+from . import jaro
+from .scorer import as_scorer
+
+class LengthIndex(object):
+    """
+    Index the strings of 'choices' by their lengths.
+
+    The choices are kept as a list ('choices'), in the order given: the
+    indexes returned by queries are positions in it. 'lengths' is the sorted
+    list of the distinct lengths, and 'buckets' maps each length to an array
+    of the indexes of the choices with that length, in increasing order.
+
+    If 'signatures' is true, 'signatures' is the list of the signatures of
+    the choices (otherwise it's None), used by queries with a threshold."""
+
+    def __init__(self, choices, signatures=False):
+        self.choices = list(choices)
+        self.signatures = None
+        if signatures:
+            self.signatures = [jaro.signature(choice)
+                                                  for choice in self.choices]
+        buckets = {}
+        for index, choice in enumerate(self.choices):
+            try:
+                buckets[len(choice)].append(index)
+            except KeyError:
+                buckets[len(choice)] = array.array('L', [index])
+        self.buckets = buckets
+        self.lengths = sorted(buckets)
+
+    @classmethod
+    def from_buckets(cls, choices, buckets, signatures=None):
+        """Make an index of 'choices' (any sequence) from the 'buckets' and
+        'signatures' (if any) worked out earlier, e.g. saved to a file."""
+        index = cls.__new__(cls)
+        index.choices = choices
+        index.signatures = signatures
+        index.buckets = buckets
+        index.lengths = sorted(buckets)
+        return index
+
+    def __len__(self):
+        return len(self.choices)
+
+    def bounded_lengths(self, len_q, threshold, scorer):
+        """
+        Return a list of (bound, length) pairs for the lengths of the choices
+        which could score at least 'threshold' against a query of 'len_q'
+        chars, where 'bound' is the most any of them could score.
+
+        The lengths are found by working out from 'len_q' in both directions,
+        stopping at the first which can't reach the threshold."""
+        (typo_table, typo_scale, boost_threshold,
+                            pre_len, pre_scale, longer_prob) = scorer.params()
+        typo_max = scorer.typo_max
+        lengths = self.lengths
+        found = []
+        start = bisect.bisect_left(lengths, len_q)
+        for positions in [range(start, len(lengths)),
+                                                  range(start - 1, -1, -1)]:
+            for position in positions:
+                len_c = lengths[position]
+                bound = jaro.fn_length_bound(min(len_q, len_c),
+                                    max(len_q, len_c), typo_max, typo_scale,
+                                        boost_threshold, pre_len, pre_scale,
+                                            longer_prob)
+                if threshold is not None and bound < threshold: break
+                found.append((bound, len_c))
+        return found
+
+    def candidates(self, query, threshold, metric=jaro.metric_jaro_winkler):
+        """Return the indexes, in increasing order, of the choices whose
+        lengths don't rule them out of scoring 'threshold' against 'query'."""
+        found = self.bounded_lengths(len(query), threshold, as_scorer(metric))
+        indexes = []
+        for bound, len_c in found:
+            indexes.extend(self.buckets[len_c])
+        indexes.sort()
+        return indexes
+
+    def search(self, query, threshold, metric=jaro.metric_jaro_winkler):
+        """
+        Find every choice scoring at least 'threshold' against 'query'.
+
+        'metric' may be any of the standard metric functions, or a Scorer.
+        Returns a list of (choice, score, index) tuples, best score first and
+        then in the order of the choices, as process.extract() would with a
+        'limit' of None."""
+        return self.extract(query, None, threshold, metric)
+
+    def extract(self, query, limit=5, score_cutoff=None,
+                                               metric=jaro.metric_jaro_winkler):
+        """
+        Find the choices which best match 'query', returning exactly what
+        process.extract() would for the same list of choices.
+
+        The lengths are visited best bound first. Once 'limit' choices have
+        been found, the search stops at the first length whose bound falls
+        below the worst of them."""
+        assert limit is None or limit > 0
+        scorer = as_scorer(metric)
+        score = jaro.query_scorer(query, *scorer.params())
+        choices = self.choices
+        signatures = self.signatures
+        found = self.bounded_lengths(len(query), score_cutoff, scorer)
+        found.sort(key=lambda entry: -entry[0])
+
+        threshold = score_cutoff
+        # Min-heap of (score, -index, choice), as in process.extract(). As the
+        # choices aren't seen in order, an equal score with an earlier index
+        # beats the worst entry too.
+        heap = []
+        for bound, len_c in found:
+            if threshold is not None and bound < threshold: break
+            for index in self.buckets[len_c]:
+                choice = choices[index]
+                if signatures is None:
+                    weight = score(choice, threshold)
+                else:
+                    weight = score(choice, threshold, signatures[index])
+                if score_cutoff is not None and weight < score_cutoff:
+                    continue
+                entry = (weight, -index, choice)
+                if limit is None or len(heap) < limit:
+                    heapq.heappush(heap, entry)
+                    if limit is not None and len(heap) == limit:
+                        threshold = heap[0][0]
+                elif entry[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, entry)
+                    threshold = heap[0][0]
+
+        heap.sort(key=lambda entry: (-entry[0], -entry[1]))
+        return [(choice, weight, -index) for weight, index, choice in heap]
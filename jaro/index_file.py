@@ -0,0 +1,303 @@
+"""
+Save a prepared set of choice strings, and its search structures, to a file
+which can be mapped straight back into memory.
+
+    index_file.save('names.idx', names, blocker=process.prefix_blocker(2))
+    names = index_file.open('names.idx')
+    names.search('MARTHA', 0.9)
+
+save() writes the strings and their offsets (as in a Corpus), their
+signatures, the strings grouped by length (as in a LengthIndex) and,
+optionally, by blocking key. open() maps the file with mmap, and reads
+nothing but the header: the sections are used in place, as memoryviews, and
+only the pages which are touched are ever read from disk. Processes opening
+the same file share those pages through the OS page cache.
+
+A file starts with a header: the magic number, the format version, the byte
+order, and a table of the sections, giving the name, typecode, position,
+size and CRC-32 checksum of each. The header has a checksum of its own. A
+file of any other version, or made on a machine of the other byte order, is
+refused; open(verify=True) also checks the sections against their
+checksums, which means reading the whole file."""
+import array
+import bisect
+import io
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+from . import jaro
+from .corpus import Corpus, to_codes
+from .index import LengthIndex
+
+magic = b'JAROIDX\0'
+version = 1
+byte_orders = ['little', 'big']
+
+# magic, version, byte order, number of sections, number of strings
+header_format = struct.Struct('<8sHBxIQ')
+# name, typecode, position, size in bytes, checksum
+section_format = struct.Struct('<16sc3xQQI4x')
+checksum_format = struct.Struct('<I')
+
+# Sections start on a multiple of this, so that their items are aligned.
+alignment = 8
+
+def block_index(blocker, strings):
+    "Map each blocking key of 'strings' to the list of their indexes."
+    blocks = {}
+    for index, string in enumerate(strings):
+        for key in set(blocker(string)):
+            blocks.setdefault(key, []).append(index)
+    return blocks
+
+def save(path, strings, blocker=None, signatures=True):
+    """
+    Write 'strings' (a Corpus, or any iterable of strings) to the index file
+    'path', replacing any file already there.
+
+    If 'signatures' is true, the signatures of the strings are saved (if
+    'strings' is a Corpus, only if it keeps them). If 'blocker' is given (a
+    function taking a string and returning an iterable of keys, which must
+    be strings [see process.prefix_blocker()]), the strings are grouped by
+    their keys as well."""
+    corpus = strings
+    if not isinstance(corpus, Corpus):
+        corpus = Corpus(strings, signatures)
+    sections = [('strings', corpus.buffer), ('offsets', corpus.offsets)]
+    if signatures and corpus.signature_bits is not None:
+        sections.append(('signature_bits', corpus.signature_bits))
+        sections.append(('signature_excess', corpus.signature_excess))
+
+    # The indexes of the strings, grouped by length, as in a LengthIndex.
+    buckets = {}
+    for position in range(len(corpus)):
+        buckets.setdefault(corpus.length(position),
+                                     array.array('Q')).append(position)
+    lengths = sorted(buckets)
+    length_order = array.array('Q')
+    length_starts = array.array('Q')
+    for length in lengths:
+        length_starts.append(len(length_order))
+        length_order.extend(buckets[length])
+    length_starts.append(len(length_order))
+    sections.append(('lengths', array.array('Q', lengths)))
+    sections.append(('length_starts', length_starts))
+    sections.append(('length_order', length_order))
+
+    if blocker is not None:
+        blocks = block_index(blocker, corpus)
+        key_text = bytearray()
+        key_offsets = array.array('Q', [0])
+        key_starts = array.array('Q', [0])
+        key_members = array.array('Q')
+        for key in sorted(blocks):
+            key_text += key.encode('utf8', 'surrogatepass')
+            key_offsets.append(len(key_text))
+            key_members.extend(blocks[key])
+            key_starts.append(len(key_members))
+        sections.append(('key_text', array.array('B', key_text)))
+        sections.append(('key_offsets', key_offsets))
+        sections.append(('key_starts', key_starts))
+        sections.append(('key_members', key_members))
+
+    # Lay out the sections after the header, each aligned.
+    table = []
+    position = (header_format.size + len(sections) * section_format.size
+                                                       + checksum_format.size)
+    for name, data in sections:
+        data = memoryview(data)
+        position += -position % alignment
+        table.append((name, data, position))
+        position += data.nbytes
+
+    header = header_format.pack(magic, version,
+                                    byte_orders.index(sys.byteorder),
+                                        len(sections), len(corpus))
+    for name, data, position in table:
+        header += section_format.pack(name.encode('ascii'),
+                                          data.format.encode('ascii'),
+                                              position, data.nbytes,
+                                                  zlib.crc32(data))
+    header += checksum_format.pack(zlib.crc32(header))
+
+    # Write to a temporary file first, so that a crash part way through
+    # never leaves a half-written index, and readers of the old one carry on.
+    temp_path = path + '.tmp'
+    with io.open(temp_path, 'wb') as f:
+        f.write(header)
+        for name, data, position in table:
+            f.write(b'\0' * (position - f.tell()))
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def read_header(data):
+    """Check the header at the start of 'data' (bytes-like), and return the
+    number of strings and a dict of the sections, mapping each name to its
+    (typecode, position, size, checksum)."""
+    if len(data) < header_format.size or data[:len(magic)] != magic:
+        raise ValueError('Not an index file')
+    (file_magic, file_version, byte_order, num_sections,
+                        num_strings) = header_format.unpack_from(data, 0)
+    if file_version != version:
+        raise ValueError('Index file version %d, not %d'
+                                                  % (file_version, version))
+    end = header_format.size + num_sections * section_format.size
+    if (len(data) < end + checksum_format.size or
+            checksum_format.unpack_from(data, end)[0] !=
+                                                    zlib.crc32(data[:end])):
+        raise ValueError('Index file header is corrupt')
+    if byte_orders[byte_order] != sys.byteorder:
+        raise ValueError('Index file made on a %s-endian machine'
+                                                     % byte_orders[byte_order])
+
+    sections = {}
+    for number in range(num_sections):
+        name, typecode, position, size, checksum = section_format.unpack_from(
+                    data, header_format.size + number * section_format.size)
+        if position + size > len(data):
+            raise ValueError('Index file is truncated')
+        sections[name.rstrip(b'\0').decode('ascii')] = (
+                        typecode.decode('ascii'), position, size, checksum)
+    return num_strings, sections
+
+class Keys(object):
+    "The sorted blocking keys of an IndexFile, as a read-only sequence."
+    __slots__ = ('text', 'offsets')
+
+    def __init__(self, text, offsets):
+        self.text = text
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, number):
+        return self.text[self.offsets[number]:self.offsets[number+1]].tobytes(
+                                            ).decode('utf8', 'surrogatepass')
+
+class Views(object):
+    "The strings of a Corpus, as a sequence of memoryviews of their codes."
+    __slots__ = ('corpus',)
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def __len__(self):
+        return len(self.corpus)
+
+    def __getitem__(self, index):
+        return self.corpus.view(index)
+
+class IndexFile(object):
+    """
+    An index file, mapped into memory [see open()].
+
+    'corpus' is a Corpus of the strings, and 'index' a LengthIndex of their
+    codes, both reading straight from the file. 'keys' is the sorted
+    sequence of the blocking keys (empty if the file has none).
+
+    An IndexFile pickles as its path, and is opened again when unpickled, so
+    it's cheap to send to other processes."""
+
+    def __init__(self, path, verify=False):
+        self.path = path
+        self.verify = verify
+        with io.open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        memory = memoryview(self.mmap)
+        num_strings, sections = read_header(memory)
+
+        self.sections = {}
+        for name, (typecode, position, size, checksum) in sections.items():
+            data = memory[position:position+size]
+            if verify and zlib.crc32(data) != checksum:
+                raise ValueError('Index file section %r is corrupt' % name)
+            self.sections[name] = data.cast(typecode)
+        section = self.sections.get
+
+        self.corpus = Corpus.from_arrays(section('strings').format,
+                            section('strings'), section('offsets'),
+                                section('signature_bits'),
+                                    section('signature_excess'))
+        assert len(self.corpus) == num_strings
+
+        lengths = section('lengths')
+        starts = section('length_starts')
+        order = section('length_order')
+        buckets = dict((length, order[starts[number]:starts[number+1]])
+                                    for number, length in enumerate(lengths))
+        self.index = LengthIndex.from_buckets(Views(self.corpus), buckets,
+                                                     self.corpus.signatures)
+
+        self.keys = Keys(memoryview(b''), [0])
+        self.key_starts = self.key_members = None
+        if 'key_text' in self.sections:
+            self.keys = Keys(section('key_text'), section('key_offsets'))
+            self.key_starts = section('key_starts')
+            self.key_members = section('key_members')
+
+    def __len__(self):
+        return len(self.corpus)
+
+    def __getitem__(self, index):
+        return self.corpus[index]
+
+    def block(self, key):
+        "The indexes of the strings with the blocking key 'key', in order."
+        number = bisect.bisect_left(self.keys, key)
+        if number == len(self.keys) or self.keys[number] != key:
+            return []
+        return self.key_members[self.key_starts[number]:
+                                                  self.key_starts[number+1]]
+
+    def extract(self, query, limit=5, score_cutoff=None,
+                                               metric=jaro.metric_jaro_winkler):
+        """Find the strings which best match 'query', returning exactly what
+        process.extract() would for the list of strings."""
+        found = self.index.extract(to_codes(query), limit, score_cutoff,
+                                                                      metric)
+        return [(self.corpus[index], weight, index)
+                                            for view, weight, index in found]
+
+    def search(self, query, threshold, metric=jaro.metric_jaro_winkler):
+        """Find every string scoring at least 'threshold' against 'query',
+        best first, as (string, score, index) tuples."""
+        return self.extract(query, None, threshold, metric)
+
+    def close(self):
+        """Unmap the file. Any memoryviews of it still held elsewhere keep it
+        mapped until they're released."""
+        self.corpus = self.index = self.keys = None
+        self.key_starts = self.key_members = None
+        for data in self.sections.values():
+            data.release()
+        self.sections = {}
+        try:
+            self.mmap.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __reduce__(self):
+        return (IndexFile, (self.path, self.verify))
+
+    def __repr__(self):
+        return '<IndexFile %r>' % self.path
+
+def open(path, verify=False):
+    """
+    Open the index file 'path', written by save(), returning an IndexFile.
+
+    Raises ValueError if the file isn't an index file of this version, or
+    its header is corrupt; with 'verify', the whole file is checked."""
+    return IndexFile(path, verify)
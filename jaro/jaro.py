@@ -3,7 +3,13 @@
 
 import os
 import sys
-from .typo_tables import adjwt
+import math
+import collections
+import contextlib
+import time
+# adjwt isn't used here, but is imported so that jaro.adjwt, where the table
+# used to live, still works.
+from .typo_tables import adjwt, adjwt_compiled, TypoTable, bytes_typo_table
 
 def fn_jaro(len1, len2, num_matches, half_transposes, typo_score, typo_scale):
     """Calculate the classic Jaro metric between two strings.
@@ -45,7 +51,139 @@ def fn_longer(weight, len1, len2, num_matches, pre_matches):
     num = (1.0 - weight) * num
     return weight + (num / den)
 
-def count_matches(s1, s2, len1, len2):
+def fn_bound(len1, len2, num_matches, half_transposes, typo_bound,
+                              boost_threshold, pre_len, pre_scale, longer_prob):
+    """
+    An upper bound on the weight metric_custom() can return for two strings.
+
+    The strings have lengths 'len1' <= 'len2', and at most 'num_matches'
+    matching chars, with at least 'half_transposes' half transpositions
+    between them. 'typo_bound' is the most the typos can add to the count of
+    similar chars (i.e. after dividing by typo_scale). The other arguments
+    are as for metric_custom().
+
+    The bound is rounded up a touch, so that it is safe to compare it
+    directly with a score calculated in the normal way."""
+    if not len1:
+        if not len2: return 1.0
+        return 0.0
+    if not num_matches: return 0.0
+
+    weight = fn_jaro(len1, len2, num_matches, half_transposes, typo_bound, 1)
+    if weight >= 1.0 or not boost_threshold:
+        return weight + 1e-9
+
+    # The prefix boost can only make things better, and the more prefix chars
+    # the better. Once the prefix scale gets too large, all bets are off.
+    pre_boost = min(len1, pre_len) * pre_scale
+    if pre_boost > 1:
+        return float('inf')
+    weight = fn_winkler(weight, min(len1, pre_len), pre_scale)
+
+    # The long string adjustment is largest when no prefix chars match.
+    if longer_prob and num_matches > 1:
+        weight = fn_longer(weight, len1, len2, num_matches, 0)
+
+    return weight + 1e-9
+
+def fn_length_bound(len1, len2, typo_max, typo_scale,
+                              boost_threshold, pre_len, pre_scale, longer_prob):
+    """
+    An upper bound on the weight metric_custom() can return for any two
+    strings with lengths 'len1' <= 'len2'.
+
+    'typo_max' is the largest score in the typo table [see max_typo_score()];
+    the other arguments are as for metric_custom()."""
+    # Every char of the shorter string can either match, or contribute (at
+    # most) one typo. If typos are worth more than matches, the best case is
+    # a single match and a typo for every other char.
+    typo_bound = 0
+    if typo_max > typo_scale:
+        typo_bound = (len1 - 1) * (typo_max / typo_scale - 1)
+    return fn_bound(len1, len2, len1, 0, typo_bound,
+                        boost_threshold, pre_len, pre_scale, longer_prob)
+
+def fn_min_matches(len1, len2, typo_max, typo_scale, boost_threshold,
+                              pre_len, pre_scale, longer_prob, score_cutoff):
+    """
+    The fewest matching chars two strings with lengths 'len1' <= 'len2' need
+    for metric_custom() to score at least 'score_cutoff'.
+
+    This works back from the cutoff through the formulas in fn_bound(), and
+    so errs on the low side. Returns 0 if no useful limit can be found."""
+    weight = score_cutoff
+    if boost_threshold:
+        if longer_prob:
+            longer = (len1 - 1) / (len1 + len2 + 2)
+            weight = (weight - longer) / (1 - longer)
+        pre_boost = min(len1, pre_len) * pre_scale
+        if pre_boost >= 1: return 0
+        weight = (weight - pre_boost) / (1 - pre_boost)
+
+    # Each unmatched char may still be worth up to 'ratio' of a match as a
+    # typo - unless typos are worth as much as matches, in which case the
+    # number of matches alone tells us nothing.
+    ratio = typo_max / typo_scale
+    if ratio >= 1: return 0
+    similar = (3 * weight - 1) * len1 * len2 / (len1 + len2)
+    matches = (similar - len1 * ratio) / (1 - ratio)
+    return max(0, math.ceil(matches - 1e-6))
+
+# A signature sketches the chars of a string: each char falls in one of
+# 'signature_buckets' buckets (by its code), and bit j*signature_buckets + b
+# of the signature's int is set if bucket b holds more than j of the chars,
+# for j below 'signature_depth'. Chars beyond that depth in a bucket are only
+# counted, as the signature's excess.
+signature_buckets = 64
+signature_depth = 4
+
+try:
+    popcount = int.bit_count
+except AttributeError:
+    def popcount(bits):
+        return bin(bits).count('1')
+
+# The bits of the first k depths of bucket 0, for each k.
+signature_fill = [sum(1 << (j * signature_buckets) for j in range(k))
+                                            for k in range(signature_depth + 1)]
+
+def signature(s):
+    """
+    Return the signature of string 's' (str or bytes), as a tuple of an int
+    of bits and the excess [see signature_matches()]."""
+    mask = signature_buckets - 1
+    counts = {}
+    for char, count in collections.Counter(s).items():
+        bucket = (ord(char) if isinstance(char, str) else char) & mask
+        counts[bucket] = counts.get(bucket, 0) + count
+    bits = 0
+    excess = 0
+    for bucket, count in counts.items():
+        if count > signature_depth:
+            excess += count - signature_depth
+            count = signature_depth
+        bits |= signature_fill[count] << bucket
+    return bits, excess
+
+def signature_matches(signature1, signature2):
+    """
+    An upper bound on the number of matching chars (as from count_matches())
+    between two strings, given their signatures.
+
+    Chars can only match equal chars, so the strings can't have more matches
+    than the sum, over each bucket, of the smaller of its two counts. The
+    common bits count that sum up to the signature depth, and the smaller of
+    the excesses bounds the rest."""
+    return (popcount(signature1[0] & signature2[0])
+                                        + min(signature1[1], signature2[1]))
+
+def max_typo_score(typo_table):
+    "Return the largest score found in 'typo_table' (0 if there's no table)."
+    if not typo_table: return 0
+    if isinstance(typo_table, TypoTable): return typo_table.max_score
+    return max([max(row.values()) for row in typo_table.values() if row] or [0])
+
+def count_matches(s1, s2, len1, len2, min_matches=0, search_range=None):
     """
     For every character in string s1, count the number of characters in
     string s2 which match, within a given range.
@@ -55,12 +193,23 @@ def count_matches(s1, s2, len1, len2):
 
     The function returns the count of matched characters, and two bit arrays
     showing which characters in each string this function managed to match
-    up."""
+    up.
+
+    If there's no point carrying on once it's clear that fewer than
+    'min_matches' characters can match, the function gives up early and
+    reports no matches at all.
+
+    The 'search_range' is normally worked out from the length of s2. It can
+    be given instead (as the original C code worked it out, from the longer
+    of the strings), in which case s1 may be the longer string."""
     # If you want to know which characters matched where, un-comment the lines
     # involving the 'where_matched' variable below.
-    assert len1 and len1 <= len2
-    search_range = max(len2//2-1, 0)
+    if search_range is None:
+        assert len1 and len1 <= len2
+        search_range = max(len2//2-1, 0)
     num_matches = 0
+    max_misses = len1 - min_matches
+    misses = 0
 
     # Bit arrays to mark which chars in the strings have already matched
     flags1 = [0]*len1
@@ -77,6 +226,10 @@ def count_matches(s1, s2, len1, len2):
                 # where_matched[i] = j
                 num_matches += 1
                 break
+        else:
+            misses += 1
+            if misses > max_misses:
+                return 0, flags1, flags2
 
     return num_matches, flags1, flags2#, where_matched
 
@@ -107,6 +260,221 @@ def count_half_transpositions(s1, s2, flags1, flags2):
 
     return half_transposes
 
+def char_masks(s):
+    """
+    Map every char in string 's' to an int, with bit j set wherever the char
+    appears at position j of the string."""
+    masks = {}
+    bit = 1
+    for char in s:
+        masks[char] = masks.get(char, 0) | bit
+        bit <<= 1
+    return masks
+
+def count_matches_bits(s1, s2, len1, len2, min_matches=0, masks2=None,
+                                                            search_range=None):
+    """
+    A faster version of count_matches(), which uses bit masks rather than
+    scanning the search range of s2 for each char of s1.
+
+    The arguments, and the count of matched chars returned, are as for
+    count_matches() - but the flags are returned as ints, with bit i set if
+    char i of the string matched, rather than as lists. 'masks2' may be used
+    to pass in char_masks(s2), if it's already known."""
+    if search_range is None:
+        assert len1 and len1 <= len2
+        search_range = max(len2//2-1, 0)
+    num_matches = 0
+    max_misses = len1 - min_matches
+    misses = 0
+
+    if masks2 is None:
+        masks2 = char_masks(s2)
+    flags1 = 0
+    unmatched2 = (1 << len2) - 1
+
+    # The chars of s2 in the search range of the current char of s1. It
+    # slides one place to the right with every char of s1 (growing at the
+    # start, while the bottom of the range is still pinned to 0). Bits past
+    # the end of s2 don't matter - no mask has them set.
+    window = (1 << (search_range + 1)) - 1
+    bit = 1
+
+    for i, char in enumerate(s1):
+        # The candidates are the unmatched chars in the window equal to the
+        # current char: the lowest set bit is the first of them.
+        candidates = masks2.get(char, 0) & window & unmatched2
+        if candidates:
+            unmatched2 ^= candidates & -candidates
+            flags1 |= bit
+            num_matches += 1
+        else:
+            misses += 1
+            if misses > max_misses:
+                return 0, 0, 0
+        bit <<= 1
+        window <<= 1
+        if i < search_range:
+            window |= 1
+
+    flags2 = ((1 << len2) - 1) ^ unmatched2
+    return num_matches, flags1, flags2
+
+def count_half_transpositions_bits(s1, s2, flags1, flags2):
+    """
+    As count_half_transpositions(), for the int flags returned by
+    count_matches_bits()."""
+    half_transposes = 0
+
+    # Pair off the matched chars of each string, lowest bits first.
+    while flags1:
+        bit1 = flags1 & -flags1
+        bit2 = flags2 & -flags2
+        if s1[bit1.bit_length() - 1] != s2[bit2.bit_length() - 1]:
+            half_transposes += 1
+        flags1 ^= bit1
+        flags2 ^= bit2
+
+    return half_transposes
+
+def count_typos_bits(s1, s2, flags1, flags2, typo_table, masks2=None):
+    """
+    As count_typos(), for the int flags returned by count_matches_bits().
+
+    Rather than scanning s2 for each unmatched char of s1, we gather up the
+    positions of all the chars similar to it from the char_masks() of s2
+    (which may be passed in as 'masks2'). The first unmatched one of those
+    is the one we want.
+
+    Returns the total typo score, and the 'flags2' bits with the positions
+    of the chars adjudged similar added."""
+    assert flags1 != (1 << len(s1)) - 1
+    if masks2 is None:
+        masks2 = char_masks(s2)
+
+    typo_score = 0
+    typos = 0
+    unmatched1 = ((1 << len(s1)) - 1) ^ flags1
+    while unmatched1:
+        bit = unmatched1 & -unmatched1
+        unmatched1 ^= bit
+        typo_row = typo_table.get(s1[bit.bit_length() - 1])
+        if not typo_row: continue
+
+        candidates = 0
+        for col in typo_row:
+            mask = masks2.get(col)
+            if mask: candidates |= mask
+        candidates &= ~(flags2 | typos)
+        if candidates:
+            bit = candidates & -candidates
+            typo_score += typo_row[s2[bit.bit_length() - 1]]
+            typos |= bit
+
+    return typo_score, flags2 | typos
+
+def bits_to_flags(bits, length):
+    "Convert the int flags from count_matches_bits() into a list of 0s and 1s."
+    return [(bits >> i) & 1 for i in range(length)]
+
+def char_positions(s):
+    """
+    Map every char in string 's' to a list of the positions it appears at.
+    The lists are in descending order, so that the next position is always
+    at the end."""
+    positions = {}
+    for j in range(len(s) - 1, -1, -1):
+        try:
+            positions[s[j]].append(j)
+        except KeyError:
+            positions[s[j]] = [j]
+    return positions
+
+def count_matches_long(s1, s2, len1, len2, min_matches=0, positions2=None,
+                                                            search_range=None):
+    """
+    A version of count_matches() for long strings, which looks up the
+    positions of each char of s1 in s2, rather than scanning the search
+    range for it.
+
+    The arguments and return values are as for count_matches(). 'positions2'
+    may be used to pass in char_positions(s2), if it's already known - note
+    that this function will use up its lists."""
+    if search_range is None:
+        assert len1 and len1 <= len2
+        search_range = max(len2//2-1, 0)
+    num_matches = 0
+    max_misses = len1 - min_matches
+    misses = 0
+
+    if positions2 is None:
+        positions2 = char_positions(s2)
+    flags1 = [0]*len1
+    flags2 = [0]*len2
+
+    # The search range only ever moves to the right, and the first unmatched
+    # occurrence of a char in range is the one to take. So for each char we
+    # can drop its positions as they fall out of range or are matched, and
+    # the next candidate is always at the end of its list.
+    for i, char in enumerate(s1):
+        positions = positions2.get(char)
+        if positions:
+            lolim = i - search_range
+            while positions and positions[-1] < lolim:
+                positions.pop()
+            if positions and positions[-1] <= i + search_range:
+                flags1[i] = flags2[positions.pop()] = 1
+                num_matches += 1
+                continue
+        misses += 1
+        if misses > max_misses:
+            return 0, flags1, flags2
+
+    return num_matches, flags1, flags2
+
+def count_typos_long(s1, s2, flags1, flags2, typo_table):
+    """
+    A version of count_typos() for long strings, which indexes the positions
+    of the unmatched chars of s2, rather than scanning the whole of s2 for
+    every unmatched char of s1.
+
+    The arguments and return values are as for count_typos()."""
+    assert 0 in flags1
+
+    # With a compiled table, we know which chars can't possibly be typos.
+    cols = typo_table.cols if isinstance(typo_table, TypoTable) else None
+
+    unmatched2 = {}
+    for j in range(len(flags2) - 1, -1, -1):
+        if flags2[j]: continue
+        col = s2[j]
+        if cols is not None and col not in cols: continue
+        try:
+            unmatched2[col].append(j)
+        except KeyError:
+            unmatched2[col] = [j]
+
+    typo_score = 0
+    for i, flag1 in enumerate(flags1):
+        if flag1: continue
+        typo_row = typo_table.get(s1[i])
+        if not typo_row: continue
+
+        # The first unmatched char of s2 similar to the char from s1 is the
+        # earliest of the first unmatched occurrences of each similar char.
+        best = None
+        for col in typo_row:
+            positions = unmatched2.get(col)
+            if positions and (best is None or positions[-1] < best[-1]):
+                best = positions
+        if best is None: continue
+
+        j = best.pop()
+        typo_score += typo_row[s2[j]]
+        flags2[j] = 2
+
+    return typo_score, flags2
+
 def count_typos(s1, s2, flags1, flags2, typo_table):
     """
     Check unmatched characters in strings 's1' and 's2' for typos.
@@ -146,22 +514,126 @@ def count_typos(s1, s2, flags1, flags2, typo_table):
 
     return typo_score, flags2
 
+# Above this length (of the longer string), the bit masks used by
+# count_matches_bits() get unwieldy, and it's quicker to look up the positions
+# of each char with count_matches_long().
+long_threshold = 100
+
+class Stats(object):
+    """
+    Counters and timers for the work done by raw_metrics().
+
+    The counters are the number of pairs scored, those given up on because
+    they couldn't reach the score_cutoff, those with a null string, those with
+    no matching chars, and the number of scans for typos. The timers add up
+    the seconds spent counting the matches, transpositions and typos, and on
+    the prefix and long string adjustments.
+
+    Collecting the stats slows scoring down a little, so it's off unless
+    asked for [see collect_stats()]. The counts aren't locked, so may come up
+    short if several threads score pairs at once."""
+    __slots__ = ('pairs', 'early_exits', 'empty', 'no_matches', 'typo_scans',
+                 'matches_time', 'transpositions_time', 'typos_time',
+                 'adjust_time')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        "Set all the counters and timers back to zero."
+        for name in self.__slots__:
+            setattr(self, name, 0 if not name.endswith('_time') else 0.0)
+
+    def snapshot(self):
+        "Return the current counts and times, as a dict."
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __repr__(self):
+        return 'Stats(%s)' % ', '.join('%s=%r' % (name, getattr(self, name))
+                                                    for name in self.__slots__)
+
+# The Stats being collected, if any. raw_metrics() checks this on every call,
+# so when it's None, it costs next to nothing.
+stats = None
+
+def enable_stats(new_stats=None):
+    """Start collecting stats into 'new_stats' (or a new Stats object, if
+    None), and return it."""
+    global stats
+    if new_stats is None:
+        new_stats = Stats()
+    stats = new_stats
+    return new_stats
+
+def disable_stats():
+    "Stop collecting stats, and return the Stats collected, if any."
+    global stats
+    old_stats, stats = stats, None
+    return old_stats
+
+@contextlib.contextmanager
+def collect_stats(new_stats=None):
+    """
+    Collect stats while in a with block:
+
+        with collect_stats() as stats:
+            ...
+        print(stats.snapshot())
+
+    Whatever was being collected before (if anything) is restored at the end
+    of the block."""
+    global stats
+    old_stats = stats
+    new_stats = enable_stats(new_stats)
+    try:
+        yield new_stats
+    finally:
+        stats = old_stats
+
+# As well as str, the metrics take strings of bytes, which are compared byte
+# for byte. They give the same scores for ASCII as the equivalent str would.
+# Memoryviews may also hold wider, unsigned codes (e.g. a slice of an array of
+# code points), which score just as the str of those code points would.
+bytes_types = (bytes, bytearray, memoryview)
+code_formats = ('B', 'H', 'I', 'L')
+
+def check_strings(s1, s2, typo_table):
+    """Check 's1' and 's2' are both str, or both strings of bytes (or codes),
+    and return the form of 'typo_table' to use for them."""
+    if isinstance(s1, str):
+        assert isinstance(s2, str)
+        return typo_table
+    for s in [s1, s2]:
+        assert isinstance(s, bytes_types)
+        if isinstance(s, memoryview):
+            assert s.ndim == 1 and s.format in code_formats
+    return bytes_typo_table(typo_table)
+
+def check_params(typo_scale, boost_threshold, pre_len, pre_scale):
+    """Sanity check the parameters shared by string_metrics() and friends."""
+    assert typo_scale > 0
+    assert boost_threshold is None or boost_threshold > 0
+    assert pre_len >= 0
+    assert 1 >= pre_scale >= 0
+
 def string_metrics(s1, s2, typo_table=None, typo_scale=1, boost_threshold=None,
-                   pre_len=0, pre_scale=0, longer_prob=False):
+                   pre_len=0, pre_scale=0, longer_prob=False, score_cutoff=None,
+                   typo_max=None):
     """
     Calculate the string params and flags required by Jaro Winkler routines.
 
     For more detail of what the various arguments to this function mean and
     do, see the metric_custom() function.
+
+    If 'score_cutoff' is given, and the strings provably can't reach that
+    score under metric_custom(), they are reported as having no matches. If
+    you've already worked out the max_typo_score() of the typo table, pass it
+    in as 'typo_max' to save working it out again.
     """
     # Defaults are chosen to do least work necessary to get the valuesfor the
     # Jaro metric.
-    assert isinstance(s1, str)
-    assert isinstance(s2, str)
-    assert typo_scale > 0
-    assert boost_threshold is None or boost_threshold > 0
-    assert pre_len >= 0
-    assert 1 >= pre_scale >= 0
+    typo_table = check_strings(s1, s2, typo_table)
+    check_params(typo_scale, boost_threshold, pre_len, pre_scale)
 
     len1 = len(s1)
     len2 = len(s2)
@@ -169,25 +641,111 @@ def string_metrics(s1, s2, typo_table=None, typo_scale=1, boost_threshold=None,
     if len2 < len1:
         s1, s2 = s2, s1
         len1, len2 = len2, len1
-    assert len1 <= len2
 
-    if not (len1 and len2): return len1, len2, 0, 0, 0, 0, False
+    return raw_metrics(s1, s2, len1, len2, typo_table, typo_scale,
+                          boost_threshold, pre_len, pre_scale, longer_prob,
+                              score_cutoff, typo_max)
 
-    num_matches, flags1, flags2 = count_matches(s1, s2, len1, len2)
+def raw_metrics(s1, s2, len1, len2, typo_table, typo_scale, boost_threshold,
+                pre_len, pre_scale, longer_prob, score_cutoff=None,
+                typo_max=None, masks2=None):
+    """
+    The body of string_metrics(), without any of its argument checks.
 
-    # If no characters in common - return
-    if not num_matches: return len1, len2, 0, 0, 0, 0, False
+    len1 and len2 are the pre-calculated lengths of string s1 and s2
+    respectively, and s1 must be the shorter string. 'typo_max' and 'masks2'
+    may be used to pass in the (pre-calculated) max_typo_score() of the typo
+    table, and char_masks() of s2.
+
+    The matches, transpositions and typos are counted with
+    count_matches_bits(), count_half_transpositions_bits() and
+    count_typos_bits() or, if s2 is longer than 'long_threshold', with
+    count_matches_long() and count_typos_long(). They all give the same
+    answers as the original count_matches(), count_half_transpositions() and
+    count_typos() functions (kept as the reference implementations)."""
+    assert len1 <= len2
+    # Only look at the global once, and only do anything more if it's set.
+    counts = stats
+    if counts is not None:
+        counts.pairs += 1
+        timer = time.perf_counter
+
+    if not (len1 and len2):
+        if counts is not None: counts.empty += 1
+        return len1, len2, 0, 0, 0, 0, False
+
+    min_matches = 0
+    if score_cutoff:
+        if typo_max is None:
+            typo_max = max_typo_score(typo_table)
+        # Could the strings reach the cutoff, even if every char matched?
+        bound = fn_length_bound(len1, len2, typo_max, typo_scale,
+                                  boost_threshold, pre_len, pre_scale,
+                                      longer_prob)
+        if bound < score_cutoff:
+            if counts is not None: counts.early_exits += 1
+            return len1, len2, 0, 0, 0, 0, False
+        min_matches = fn_min_matches(len1, len2, typo_max, typo_scale,
+                                        boost_threshold, pre_len, pre_scale,
+                                            longer_prob, score_cutoff)
+
+    if counts is not None: start = timer()
+    is_long = len2 > long_threshold
+    if is_long:
+        num_matches, flags1, flags2 = count_matches_long(s1, s2, len1, len2,
+                                                                   min_matches)
+    else:
+        if masks2 is None:
+            masks2 = char_masks(s2)
+        num_matches, flags1, flags2 = count_matches_bits(s1, s2, len1, len2,
+                                                          min_matches, masks2)
+    if counts is not None: counts.matches_time += timer() - start
 
-    half_transposes = count_half_transpositions(s1, s2, flags1, flags2)
+    # If no characters in common - return
+    if not num_matches:
+        if counts is not None:
+            # count_matches() also returns no matches when it gives up.
+            if min_matches:
+                counts.early_exits += 1
+            else:
+                counts.no_matches += 1
+        return len1, len2, 0, 0, 0, 0, False
+
+    if counts is not None: start = timer()
+    if is_long:
+        half_transposes = count_half_transpositions(s1, s2, flags1, flags2)
+    else:
+        half_transposes = count_half_transpositions_bits(s1, s2,
+                                                               flags1, flags2)
+    if counts is not None: counts.transpositions_time += timer() - start
+
+    if score_cutoff:
+        # Now we know the matches, could the typos still make up the numbers?
+        typo_bound = (len1 - num_matches) * typo_max / typo_scale
+        bound = fn_bound(len1, len2, num_matches, half_transposes, typo_bound,
+                            boost_threshold, pre_len, pre_scale, longer_prob)
+        if bound < score_cutoff:
+            if counts is not None: counts.early_exits += 1
+            return len1, len2, 0, 0, 0, 0, False
 
     # adjust for similarities in non-matched characters
     typo_score = 0
     if typo_table and len1 > num_matches:
-        typo_score, flags2 = count_typos(s1, s2, flags1, flags2, typo_table)
+        if counts is not None: start = timer()
+        if is_long:
+            typo_score, flags2 = count_typos_long(s1, s2, flags1, flags2,
+                                                                    typo_table)
+        else:
+            typo_score, flags2 = count_typos_bits(s1, s2, flags1, flags2,
+                                                          typo_table, masks2)
+        if counts is not None:
+            counts.typo_scans += 1
+            counts.typos_time += timer() - start
 
     if not boost_threshold:
         return len1, len2, num_matches, half_transposes, typo_score, 0, 0
 
+    if counts is not None: start = timer()
     pre_matches = 0
     adjust_long = False
     weight_typo = fn_jaro(len1, len2, num_matches, half_transposes,
@@ -197,6 +755,10 @@ def string_metrics(s1, s2, typo_table=None, typo_scale=1, boost_threshold=None,
     if weight_typo > boost_threshold:
         # Adjust for having up to first 'pre_len' chars (not digits) in common
         limit = min(len1, pre_len)
+        if not isinstance(s1, str):
+            # Only chars have isalpha(), so decode what we need of the codes.
+            s1 = ''.join(map(chr, s1[:max(limit, 1)]))
+            s2 = ''.join(map(chr, s2[:limit]))
         while pre_matches < limit:
             char1 = s1[pre_matches]
             if not( char1.isalpha() and char1 == s2[pre_matches] ):
@@ -213,54 +775,87 @@ def string_metrics(s1, s2, typo_table=None, typo_scale=1, boost_threshold=None,
             cond = cond and s1[0].isalpha()
             if cond:
                 adjust_long = True
+    if counts is not None: counts.adjust_time += timer() - start
 
     return (len1, len2, num_matches, half_transposes,
                 typo_score, pre_matches, adjust_long)
 
-def metric_jaro(string1, string2):
-    "The standard, basic Jaro string metric."
+def fn_custom(metrics, typo_scale, pre_scale):
+    """
+    Combine the output of string_metrics() into the final, adjusted weight.
 
-    ans = string_metrics(string1, string2)
+    This is the calculation done by metric_custom(), and (with the
+    appropriate parameters) gives exactly the same numbers as metric_jaro(),
+    metric_jaro_winkler() and metric_original()."""
+    (len1, len2, num_matches, half_transposes,
+                                 typo_score, pre_matches, adjust_long) = metrics
+
+    weight_typo = fn_jaro(len1, len2, num_matches, half_transposes,
+                                                         typo_score, typo_scale)
+    weight_longer = fn_winkler(weight_typo, pre_matches, pre_scale)
+    if adjust_long:
+        weight_longer = fn_longer(weight_longer, len1, len2,
+                                                       num_matches, pre_matches)
+
+    return weight_longer
+
+def metric_jaro(string1, string2, score_cutoff=None):
+    """The standard, basic Jaro string metric.
+
+    Scores below 'score_cutoff' (if given) are returned as 0.0."""
+
+    ans = string_metrics(string1, string2, score_cutoff=score_cutoff)
     len1, len2, num_matches, half_transposes = ans[:4]
     assert ans[4:] == (0, 0, False)
 
-    return fn_jaro(len1, len2, num_matches, half_transposes, 0, 1)
+    weight = fn_jaro(len1, len2, num_matches, half_transposes, 0, 1)
+    if score_cutoff is not None and weight < score_cutoff: return 0.0
+    return weight
 
-def metric_jaro_winkler(string1, string2):
+def metric_jaro_winkler(string1, string2, score_cutoff=None):
     """The Jaro metric adjusted with Winkler's modification, which boosts
-    the metric for strings whose prefixes match."""
+    the metric for strings whose prefixes match.
+
+    Scores below 'score_cutoff' (if given) are returned as 0.0."""
 
     pre_scale = 0.1
 
     ans = string_metrics(string1, string2,
                              boost_threshold=0.7, pre_len=4,
                                 # typo_table=adjwt, typo_scale=type_scale,
-                                     pre_scale=pre_scale, longer_prob=False)
+                                     pre_scale=pre_scale, longer_prob=False,
+                                         score_cutoff=score_cutoff)
 
     (len1, len2, num_matches, half_transposes,
                                      typo_score, pre_matches, adjust_long) = ans
     assert typo_score == int(adjust_long) == 0
 
     weight_jaro = fn_jaro(len1, len2, num_matches, half_transposes, 0, 1)
-    return fn_winkler(weight_jaro, pre_matches, pre_scale)
+    weight = fn_winkler(weight_jaro, pre_matches, pre_scale)
+    if score_cutoff is not None and weight < score_cutoff: return 0.0
+    return weight
 
-def metric_original(string1, string2):
+def metric_original(string1, string2, score_cutoff=None):
     """The same metric that would be returned from the reference Jaro-Winkler
     C code, taking as it does into account a typo table and adjustments for
     longer strings.
 
     This function uses the original table from the reference C code
-    ('adjwt'), which contained only ASCII capital letters and numbers. If
-    you want to adjust for lower case letters and different character sets,
-    you need to define your own table. See the typo_tables.py module for
-    more detail."""
+    ('adjwt', compiled into a TypoTable for speed), which contained only
+    ASCII capital letters and numbers. If you want to adjust for lower case
+    letters and different character sets, you need to define your own table.
+    See the typo_tables.py module for more detail.
+
+    Scores below 'score_cutoff' (if given) are returned as 0.0."""
     pre_scale = 0.1
     typo_scale = 10
 
     ans = string_metrics(string1, string2,
                              boost_threshold=0.7, pre_len=4,
-                                typo_table=adjwt, typo_scale=typo_scale,
-                                     pre_scale=pre_scale, longer_prob=True)
+                                typo_table=adjwt_compiled,
+                                    typo_scale=typo_scale,
+                                     pre_scale=pre_scale, longer_prob=True,
+                                         score_cutoff=score_cutoff)
 
     (len1, len2, num_matches, half_transposes,
                                      typo_score, pre_matches, adjust_long) = ans
@@ -273,10 +868,98 @@ def metric_original(string1, string2):
         weight_longer = fn_longer(weight_longer, len1, len2,
                                                        num_matches, pre_matches)
 
+    if score_cutoff is not None and weight_longer < score_cutoff: return 0.0
     return weight_longer
 
+def not_num(char):
+    "The NOTNUM() macro of the C code: is 'char' anything but an ASCII digit?"
+    return not '0' <= char <= '9'
+
+def metric_strcmp95(string1, string2, larger_tol=False, to_upper=False):
+    """
+    The score the reference C function, strcmp95(), gives - exactly, and
+    with its flags.
+
+    metric_original() cleans up some of the C code's quirks. This function
+    keeps them all, for when you need to match the census numbers bit for
+    bit:
+
+    - Leading and trailing spaces are trimmed, and a blank string (including
+      the null string) never matches anything, not even another blank one.
+    - If 'to_upper', the strings are upper-cased (after the lengths are
+      taken) before they're compared.
+    - The first string isn't swapped with the second, even if it's longer,
+      and the search range is worked out from the longer string.
+    - Only chars up to code 90 ('Z') can be typos, as in the original table.
+    - The prefix boost applies to the first 4 chars which match and aren't
+      digits (not just letters), and the long string adjustment to strings
+      which don't start with a digit.
+    - The long string adjustment, made if 'larger_tol' is set, is calculated
+      in the C code's order, which can give a different last bit or so.
+
+    It gives the same score as the strcmp95() function in the strcmp95.py
+    module, without the padding, or any debug output."""
+    assert isinstance(string1, str)
+    assert isinstance(string2, str)
+    if not (string1.strip() and string2.strip()):
+        return 0.0
+
+    s1 = string1.strip(' ')
+    s2 = string2.strip(' ')
+    len1 = len(s1)
+    len2 = len(s2)
+    if to_upper:
+        # upper() can lengthen a string (German 'ß' becomes 'SS'), but the C
+        # code only ever looks at the original number of chars.
+        s1 = s1.upper()[:len1]
+        s2 = s2.upper()[:len2]
+
+    minv = min(len1, len2)
+    search_range = max(max(len1, len2)//2 - 1, 0)
+    if max(len1, len2) > long_threshold:
+        num_matches, flags1, flags2 = count_matches_long(s1, s2, len1, len2,
+                                                    search_range=search_range)
+        if not num_matches: return 0.0
+        half_transposes = count_half_transpositions(s1, s2, flags1, flags2)
+    else:
+        masks2 = char_masks(s2)
+        num_matches, flags1, flags2 = count_matches_bits(s1, s2, len1, len2,
+                                        0, masks2, search_range=search_range)
+        if not num_matches: return 0.0
+        half_transposes = count_half_transpositions_bits(s1, s2,
+                                                               flags1, flags2)
+
+    # adjust for similarities in non-matched characters
+    typo_score = 0
+    if minv > num_matches:
+        if max(len1, len2) > long_threshold:
+            typo_score = count_typos_long(s1, s2, flags1, flags2,
+                                                        adjwt_compiled)[0]
+        else:
+            typo_score = count_typos_bits(s1, s2, flags1, flags2,
+                                                adjwt_compiled, masks2)[0]
+
+    weight = fn_jaro(len1, len2, num_matches, half_transposes, typo_score, 10)
+    if weight > 0.7:
+        limit = min(minv, 4)
+        pre_matches = 0
+        while (pre_matches < limit and s1[pre_matches] == s2[pre_matches]
+                                          and not_num(s1[pre_matches])):
+            pre_matches += 1
+        weight = fn_winkler(weight, pre_matches, 0.1)
+
+        if (larger_tol and minv > 4 and num_matches > pre_matches + 1
+                and 2 * num_matches >= minv + pre_matches
+                    and not_num(s1[0])):
+            t = (1.0 * num_matches - pre_matches - 1) / (
+                                        len1 + len2 - pre_matches*2 + 2)
+            weight += (1 - weight) * t
+
+    return weight
+
 def metric_custom(string1, string2, typo_table, typo_scale,
-                              boost_threshold, pre_len, pre_scale, longer_prob):
+                              boost_threshold, pre_len, pre_scale, longer_prob,
+                                                            score_cutoff=None):
     """
     Calculate the Jaro-Winkler metric with parameters of your own choosing.
 
@@ -294,24 +977,187 @@ def metric_custom(string1, string2, typo_table, typo_scale,
     the distance can become larger than 1.
 
     The 'longer' flag tells the functions to make a further adjustment to
-    the distance if the strings have a longer prefix in common."""
+    the distance if the strings have a longer prefix in common.
+
+    If you're only interested in scores of at least 'score_cutoff', pass it
+    in: pairs which can't reach it are abandoned as early as possible, and
+    any score below it is returned as 0.0."""
     ans = string_metrics(string1, string2,
                             typo_table, typo_scale,
                                 boost_threshold, pre_len,
-                                    pre_scale, longer_prob)
+                                    pre_scale, longer_prob, score_cutoff)
+
+    weight = fn_custom(ans, typo_scale, pre_scale)
+    if score_cutoff is not None and weight < score_cutoff: return 0.0
+    return weight
+
+# Everything metric_all() knows about a pair of strings.
+Metrics = collections.namedtuple('Metrics', [
+    'len1', 'len2', 'num_matches', 'half_transposes',
+    'typo_score', 'pre_matches', 'adjust_long',
+    'weight_jaro', 'weight_typo', 'weight_winkler',
+    'weight_winkler_typo', 'weight_longer'])
+
+def metric_all(string1, string2, longer_prob=True):
+    """
+    Calculate all the variations of the metric at once.
+
+    Returns a Metrics tuple, holding the output of string_metrics() (with the
+    parameters of metric_original()) and these weights:
+
+        weight_jaro          the same as metric_jaro()
+        weight_typo          weight_jaro, adjusted for typos
+        weight_winkler       the same as metric_jaro_winkler()
+        weight_winkler_typo  weight_typo, with Winkler's adjustment
+        weight_longer        the same as metric_original() (if 'longer_prob'
+                             is set; otherwise, weight_winkler_typo)
+
+    The matches, transpositions and prefix are only worked out once, so this
+    is much cheaper than calling each of the metric functions in turn."""
+    pre_scale = 0.1
+    typo_scale = 10
+    boost_threshold = 0.7
+
+    ans = string_metrics(string1, string2,
+                            boost_threshold=boost_threshold, pre_len=4,
+                               typo_table=adjwt_compiled, typo_scale=typo_scale,
+                                  pre_scale=pre_scale, longer_prob=longer_prob)
 
     (len1, len2, num_matches, half_transposes,
                                      typo_score, pre_matches, adjust_long) = ans
 
+    weight_jaro = fn_jaro(len1, len2, num_matches, half_transposes, 0, 1)
     weight_typo = fn_jaro(len1, len2, num_matches, half_transposes,
                                                          typo_score, typo_scale)
+
+    # string_metrics() looks at the prefix if the weight *with* typos is over
+    # the threshold, but metric_jaro_winkler() only does so if the weight
+    # without them is.
+    winkler_matches = pre_matches if weight_jaro > boost_threshold else 0
+    weight_winkler = fn_winkler(weight_jaro, winkler_matches, pre_scale)
     weight_winkler_typo = fn_winkler(weight_typo, pre_matches, pre_scale)
     weight_longer = weight_winkler_typo
+
     if adjust_long:
         weight_longer = fn_longer(weight_longer, len1, len2,
                                                        num_matches, pre_matches)
 
-    return weight_longer
+    return Metrics(len1, len2, num_matches, half_transposes,
+                      typo_score, pre_matches, adjust_long,
+                          weight_jaro, weight_typo, weight_winkler,
+                              weight_winkler_typo, weight_longer)
+
+def query_scorer(query, typo_table, typo_scale,
+                              boost_threshold, pre_len, pre_scale, longer_prob):
+    """
+    Return a function which scores the string 'query' against a single choice.
+
+    The returned function, score(choice, score_cutoff=None, signature=None),
+    gives exactly the same score as metric_custom() would for that pair, but
+    the parameters are checked, and the query examined, only once, here.
+    Passing in the signature() of the choice (worked out once, for choices
+    scored against many queries) lets it rule out, with a cutoff, choices
+    with too few chars in common with the query to reach it."""
+    query_type = str if isinstance(query, str) else bytes_types
+    typo_table = check_strings(query, query, typo_table)
+    check_params(typo_scale, boost_threshold, pre_len, pre_scale)
+    typo_max = max_typo_score(typo_table)
+
+    len_q = len(query)
+    # A choice with no chars in common with the query can't score anything,
+    # and we can tell that without a call to count_matches().
+    query_chars = frozenset(query)
+    query_masks = char_masks(query)
+    # Only worked out if it's needed. (score()'s argument hides the function.)
+    query_signature = []
+    signature_of = signature
+    # The fn_min_matches() for each (choice length, cutoff) seen.
+    min_matches = {}
+
+    def score(choice, score_cutoff=None, signature=None):
+        assert isinstance(choice, query_type)
+        len_c = len(choice)
+        if not (len_q and len_c):
+            if stats is not None:
+                stats.pairs += 1
+                stats.empty += 1
+            return 1.0 if len_q == len_c else 0.0
+        if query_chars.isdisjoint(choice):
+            if stats is not None:
+                stats.pairs += 1
+                stats.no_matches += 1
+            return 0.0
+
+        if signature is not None and score_cutoff:
+            if not query_signature:
+                query_signature.append(signature_of(query))
+            try:
+                needed = min_matches[len_c, score_cutoff]
+            except KeyError:
+                needed = min_matches[len_c, score_cutoff] = fn_min_matches(
+                            min(len_q, len_c), max(len_q, len_c), typo_max,
+                                typo_scale, boost_threshold, pre_len,
+                                    pre_scale, longer_prob, score_cutoff)
+            if signature_matches(query_signature[0], signature) < needed:
+                if stats is not None:
+                    stats.pairs += 1
+                    stats.early_exits += 1
+                return 0.0
+
+        if len_c < len_q:
+            ans = raw_metrics(choice, query, len_c, len_q, typo_table,
+                                 typo_scale, boost_threshold, pre_len,
+                                     pre_scale, longer_prob, score_cutoff,
+                                         typo_max, query_masks)
+        else:
+            ans = raw_metrics(query, choice, len_q, len_c, typo_table,
+                                 typo_scale, boost_threshold, pre_len,
+                                     pre_scale, longer_prob, score_cutoff,
+                                         typo_max)
+        weight = fn_custom(ans, typo_scale, pre_scale)
+        if score_cutoff is not None and weight < score_cutoff: return 0.0
+        return weight
+
+    return score
+
+def metric_custom_batch(query, choices, typo_table, typo_scale,
+                              boost_threshold, pre_len, pre_scale, longer_prob):
+    """
+    Score the string 'query' against every string in 'choices'.
+
+    Returns a list with one score per choice, each exactly the same as
+    metric_custom() would give for that pair. The parameters are checked, and
+    the query examined, only once for the whole batch - so if you need to
+    compare one string against many, this is much cheaper than calling
+    metric_custom() in a loop."""
+    score = query_scorer(query, typo_table, typo_scale,
+                            boost_threshold, pre_len, pre_scale, longer_prob)
+    return [score(choice) for choice in choices]
+
+# The metric_custom() parameters (typo_table, typo_scale, boost_threshold,
+# pre_len, pre_scale, longer_prob) which reproduce the standard metrics.
+params_jaro = (None, 1, None, 0, 0, False)
+params_jaro_winkler = (None, 1, 0.7, 4, 0.1, False)
+params_original = (adjwt_compiled, 10, 0.7, 4, 0.1, True)
+
+# Look up the parameters above by the metric function they reproduce.
+metric_params = {}
+
+def metric_jaro_batch(query, choices):
+    "Score 'query' against each of 'choices' with metric_jaro()."
+    return metric_custom_batch(query, choices, *params_jaro)
+
+def metric_jaro_winkler_batch(query, choices):
+    "Score 'query' against each of 'choices' with metric_jaro_winkler()."
+    return metric_custom_batch(query, choices, *params_jaro_winkler)
+
+def metric_original_batch(query, choices):
+    "Score 'query' against each of 'choices' with metric_original()."
+    return metric_custom_batch(query, choices, *params_original)
+
+metric_params[metric_jaro] = params_jaro
+metric_params[metric_jaro_winkler] = params_jaro_winkler
+metric_params[metric_original] = params_original
 
 if __name__ == '__main__':
 
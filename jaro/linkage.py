@@ -0,0 +1,200 @@
+"""
+Link two large collections of strings, too big to hold in memory.
+
+link() finds every pair of strings, one from each side, which score at least
+a threshold. Both sides are read just once, as iterables, and split by their
+blocking keys into bucket files on disk; the buckets are then matched one at
+a time, so only one bucket of the right hand side is ever held in memory.
+Put the smaller side on the right.
+
+Progress is saved to a checkpoint file after each bucket. If the job is
+killed, calling link() again with the same arguments picks up from the last
+finished bucket, rather than starting over."""
+import csv
+import json
+import os
+import zlib
+
+from . import jaro
+from .process import prefix_blocker
+from .scorer import as_scorer
+
+checkpoint_version = 1
+
+def bucket_number(key, num_buckets):
+    "The bucket for blocking key 'key' - the same in every process."
+    return zlib.crc32(key.encode('utf8')) % num_buckets
+
+def bucket_path(workdir, side, number):
+    return os.path.join(workdir, '%s-%04d.tsv' % (side, number))
+
+def partition(strings, workdir, side, blocker, num_buckets):
+    """Write each of 'strings', with its index, to the bucket files of its
+    blocking keys. Returns the number of strings read."""
+    files = [open(bucket_path(workdir, side, number), 'w', newline='',
+                       encoding='utf8') for number in range(num_buckets)]
+    try:
+        writers = [csv.writer(f, delimiter='\t', lineterminator='\n')
+                                                                for f in files]
+        count = 0
+        for index, string in enumerate(strings):
+            for key in set(blocker(string)):
+                writers[bucket_number(key, num_buckets)].writerow(
+                                                        (index, key, string))
+            count += 1
+    finally:
+        for f in files:
+            f.close()
+    return count
+
+def read_bucket(workdir, side, number):
+    "Yield the (index, key, string) rows of a bucket file."
+    with open(bucket_path(workdir, side, number), newline='',
+                                                     encoding='utf8') as f:
+        for index, key, string in csv.reader(f, delimiter='\t'):
+            yield int(index), key, string
+
+def load_checkpoint(path, settings):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf8') as f:
+        state = json.load(f)
+    if state['settings'] != settings:
+        raise ValueError('Checkpoint %s was made with different settings: %r'
+                                                 % (path, state['settings']))
+    return state
+
+def save_checkpoint(path, state):
+    # Write to a temporary file first, so that a crash part way through
+    # never leaves a half-written checkpoint.
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf8') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def match_bucket(workdir, number, scorer, threshold, blocker, writer):
+    """Score the strings in bucket 'number' of the left side against those
+    sharing a blocking key on the right, writing out the matches. Returns
+    the number of matches written."""
+    params = scorer.params()
+    (typo_table, typo_scale, boost_threshold,
+                            pre_len, pre_scale, longer_prob) = params
+    typo_max = scorer.typo_max
+
+    right = {}
+    for index, key, string in read_bucket(workdir, 'right', number):
+        right.setdefault(key, []).append((index, string))
+    if not right:
+        return 0
+
+    right_keys = {}
+    bounds = {}
+    num_matches = 0
+    for index1, key, string1 in read_bucket(workdir, 'left', number):
+        candidates = right.get(key)
+        if not candidates: continue
+        left_keys = None
+        score = jaro.query_scorer(string1, *params)
+        len1 = len(string1)
+
+        for index2, string2 in candidates:
+            len2 = len(string2)
+            try:
+                bound = bounds[len1, len2]
+            except KeyError:
+                bounds[len1, len2] = bound = jaro.fn_length_bound(
+                                min(len1, len2), max(len1, len2), typo_max,
+                                    typo_scale, boost_threshold, pre_len,
+                                        pre_scale, longer_prob)
+            if bound < threshold: continue
+
+            weight = score(string2, threshold)
+            if weight < threshold: continue
+
+            # A pair sharing several blocking keys (possibly in different
+            # buckets) is only written out under the first of them.
+            if left_keys is None:
+                left_keys = set(blocker(string1))
+            if len(left_keys) > 1:
+                if string2 not in right_keys:
+                    right_keys[string2] = set(blocker(string2))
+                if key != min(left_keys & right_keys[string2]): continue
+
+            writer.writerow((index1, index2, string1, string2, repr(weight)))
+            num_matches += 1
+    return num_matches
+
+def link(left, right, output, threshold, metric=jaro.metric_original,
+             blocker=None, num_buckets=256, workdir=None, checkpoint=None):
+    """
+    Find the pairs of strings, one from 'left' and one from 'right', which
+    score at least 'threshold' under 'metric' (any of the standard metric
+    functions, or a Scorer).
+
+    Only strings sharing a blocking key are compared. 'blocker' is a function
+    taking a string and returning an iterable of keys, which must be strings
+    [see process.prefix_blocker(), which is the default, on the first char].
+
+    The matches are written to the file 'output' as tab separated rows of
+    (left index, right index, left string, right string, score), where the
+    indexes are the positions of the strings in 'left' and 'right'. The rows
+    come out grouped by bucket, not in any particular order.
+
+    Working files go in 'workdir' (by default, 'output' + '.buckets'), and
+    the checkpoint in 'checkpoint' (by default, 'output' + '.checkpoint').
+    Both are removed when the job finishes. Pick 'num_buckets' so that the
+    biggest bucket of 'right' fits comfortably in memory; it can't be
+    changed when resuming. Returns the number of matches found."""
+    scorer = as_scorer(metric)
+    if blocker is None:
+        blocker = prefix_blocker(1)
+    if workdir is None:
+        workdir = output + '.buckets'
+    if checkpoint is None:
+        checkpoint = output + '.checkpoint'
+    assert num_buckets > 0
+
+    # Typo tables don't have a stable repr, so custom Scorers are only
+    # checked on their other parameters.
+    settings = {'version': checkpoint_version, 'num_buckets': num_buckets,
+                'threshold': threshold,
+                'metric': scorer.name or repr(scorer.params()[1:])}
+    state = load_checkpoint(checkpoint, settings)
+    if state is None:
+        # Nothing has been saved, so any output is from a run which died
+        # while partitioning. Start from scratch.
+        os.makedirs(workdir, exist_ok=True)
+        partition(left, workdir, 'left', blocker, num_buckets)
+        partition(right, workdir, 'right', blocker, num_buckets)
+        open(output, 'w').close()
+        state = {'settings': settings, 'done': [], 'offset': 0, 'matches': 0}
+        save_checkpoint(checkpoint, state)
+
+    # Throw away anything written for a bucket that wasn't finished.
+    with open(output, 'r+b') as f:
+        f.truncate(state['offset'])
+
+    done = set(state['done'])
+    with open(output, 'a', newline='', encoding='utf8') as f:
+        writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+        for number in range(num_buckets):
+            if number in done: continue
+            state['matches'] += match_bucket(workdir, number, scorer,
+                                                 threshold, blocker, writer)
+            f.flush()
+            os.fsync(f.fileno())
+            state['offset'] = os.fstat(f.fileno()).st_size
+            state['done'].append(number)
+            save_checkpoint(checkpoint, state)
+
+    for side in ['left', 'right']:
+        for number in range(num_buckets):
+            os.remove(bucket_path(workdir, side, number))
+    try:
+        os.rmdir(workdir)
+    except OSError:
+        pass
+    os.remove(checkpoint)
+    return state['matches']
@@ -0,0 +1,187 @@
+"""
+Normalise strings before they're compared.
+
+The metrics compare strings exactly as given, so callers usually tidy them up
+first: trimming spaces, folding case, taking the accents off letters and
+throwing away punctuation. When the same strings (a list of reference names,
+say) are compared over and over, doing that every time can cost as much as
+the comparison itself.
+
+A Normaliser does it once per distinct string: it keeps the normalised form
+of the strings it has seen in a bounded LRU cache. For a list of choices
+which will be scored against many queries, prepare() normalises the whole
+list up front. A metric attached to a Normaliser [see attach()] normalises
+its arguments before scoring them, and accepts prepared choice lists as they
+are."""
+import functools
+import unicodedata
+
+from . import process
+from .scorer import as_scorer
+
+cases = (None, 'upper', 'lower', 'casefold')
+
+# Deleting the ASCII punctuation needs no lookups in the Unicode database.
+ascii_punctuation = dict.fromkeys(ord(char) for char in
+                                      '!"#%&\'()*,-./:;?@[\\]_{}')
+
+class Normaliser(object):
+    """
+    Normalise strings, remembering the results for up to 'maxsize' distinct
+    strings (or without limit, if None).
+
+    In order, the steps are: folding accents - decomposing each char (with
+    Unicode's NFKD) and dropping the combining marks, so that 'é' becomes 'e'
+    and the ligature 'ﬁ' becomes 'fi'; removing punctuation (any char in one
+    of Unicode's punctuation categories); changing the case to 'upper',
+    'lower' or 'casefold' (or leaving it alone, for None); and stripping
+    leading and trailing whitespace. Each step can be turned off.
+
+    Normalisers with the same settings compare equal, and pickle without
+    their cache."""
+
+    def __init__(self, strip=True, case='upper', fold_accents=True,
+                     remove_punctuation=True, maxsize=65536):
+        assert case in cases
+        assert maxsize is None or maxsize > 0
+        self.strip = strip
+        self.case = case
+        self.fold_accents = fold_accents
+        self.remove_punctuation = remove_punctuation
+        self.maxsize = maxsize
+        self.lookup = functools.lru_cache(maxsize)(self.normalise)
+
+    def settings(self):
+        return (self.strip, self.case, self.fold_accents,
+                    self.remove_punctuation)
+
+    def normalise(self, string):
+        "Return the normalised form of 'string', without using the cache."
+        assert isinstance(string, str)
+        ascii = string.isascii()
+        if self.fold_accents and not ascii:
+            string = ''.join(char for char in
+                                 unicodedata.normalize('NFKD', string)
+                                     if not unicodedata.combining(char))
+            ascii = string.isascii()
+        if self.remove_punctuation:
+            if ascii:
+                string = string.translate(ascii_punctuation)
+            else:
+                string = ''.join(char for char in string
+                            if not unicodedata.category(char).startswith('P'))
+        if self.case is not None:
+            string = getattr(string, self.case)()
+        if self.strip:
+            string = string.strip()
+        return string
+
+    def __call__(self, string):
+        "Return the normalised form of 'string', from the cache if possible."
+        return self.lookup(string)
+
+    def cache_info(self):
+        "The hits, misses and size of the cache, as for functools.lru_cache."
+        return self.lookup.cache_info()
+
+    def cache_clear(self):
+        self.lookup.cache_clear()
+
+    def prepare(self, choices):
+        """Normalise every string in 'choices' once, for scoring against any
+        number of queries. Returns a NormalisedChoices."""
+        choices = list(choices)
+        return NormalisedChoices(self, choices,
+                                     [self.normalise(choice)
+                                                    for choice in choices])
+
+    def attach(self, metric):
+        """Return a version of 'metric' (a Scorer or standard metric function)
+        which normalises its strings with this Normaliser first."""
+        return NormalisedMetric(self, metric)
+
+    def __eq__(self, other):
+        if not isinstance(other, Normaliser):
+            return NotImplemented
+        return self.settings() == other.settings()
+
+    def __hash__(self):
+        return hash(self.settings())
+
+    def __reduce__(self):
+        return (Normaliser, self.settings() + (self.maxsize,))
+
+    def __repr__(self):
+        return ('Normaliser(strip=%r, case=%r, fold_accents=%r, '
+                'remove_punctuation=%r, maxsize=%r)'
+                                        % (self.settings() + (self.maxsize,)))
+
+class NormalisedChoices(object):
+    """A list of choices, as given ('choices') and normalised ('strings') by
+    'normaliser'. Iterating over it gives the normalised strings, so it can
+    be passed to any function taking a list of choices."""
+    __slots__ = ('normaliser', 'choices', 'strings')
+
+    def __init__(self, normaliser, choices, strings):
+        assert len(choices) == len(strings)
+        self.normaliser = normaliser
+        self.choices = choices
+        self.strings = strings
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __iter__(self):
+        return iter(self.strings)
+
+    def __getitem__(self, index):
+        return self.strings[index]
+
+class NormalisedMetric(object):
+    """A metric which normalises its strings before scoring them. Call it
+    just like the metric: metric(string1, string2, score_cutoff=None)."""
+    __slots__ = ('normaliser', 'scorer')
+
+    def __init__(self, normaliser, metric):
+        self.normaliser = normaliser
+        self.scorer = as_scorer(metric)
+
+    def __call__(self, string1, string2, score_cutoff=None):
+        normalise = self.normaliser
+        return self.scorer(normalise(string1), normalise(string2),
+                                                                score_cutoff)
+
+    def strings(self, choices):
+        """The normalised strings of 'choices' - as they are, if they were
+        prepared by an equal Normaliser."""
+        if (isinstance(choices, NormalisedChoices) and
+                                        choices.normaliser == self.normaliser):
+            return choices.strings
+        return [self.normaliser(choice) for choice in choices]
+
+    def batch(self, query, choices, score_cutoff=None):
+        """Score 'query' against every string in 'choices' (which may be a
+        NormalisedChoices), returning a list of scores."""
+        return self.scorer.batch(self.normaliser(query), self.strings(choices),
+                                                                 score_cutoff)
+
+    def extract(self, query, choices, limit=5, score_cutoff=None):
+        """Find the choices which best match 'query' [see process.extract()].
+        The choices are returned as given, not normalised."""
+        if isinstance(choices, NormalisedChoices):
+            originals = choices.choices
+        else:
+            originals = choices = list(choices)
+        found = process.extract(self.normaliser(query), self.strings(choices),
+                                    limit, score_cutoff, self.scorer)
+        return [(originals[index], weight, index)
+                                            for choice, weight, index in found]
+
+def normalised_metric(metric, strip=True, case='upper', fold_accents=True,
+                          remove_punctuation=True, maxsize=65536):
+    """Return a version of 'metric' (a Scorer or standard metric function)
+    which normalises its strings first, with its own Normaliser [which see].
+    The Normaliser is available as the 'normaliser' attribute of the returned
+    function."""
+    return Normaliser(strip, case, fold_accents, remove_punctuation,
+                                                        maxsize).attach(metric)
@@ -0,0 +1,254 @@
+"""
+Score many pairs of strings at once, with NumPy.
+
+score_pairs() compares left[i] with right[i] for every i, giving exactly the
+same scores as the metric functions would, but without paying the overhead
+of the Python interpreter for every pair. The strings are encoded as padded
+matrices of code points, a chunk of pairs at a time, and each step of the
+calculation (matching, transpositions, typos, the prefix) is done for the
+whole chunk at once. The loops that are left run over the positions within
+the strings, not over the pairs, so this pays off for long lists of short
+strings, like names.
+
+This module needs NumPy, which the rest of the package doesn't; import it
+only when you need it."""
+import numpy as np
+
+from . import jaro
+from .scorer import as_scorer
+
+# The padding of the code point matrices. They're different, so that the
+# padding of one string never matches that of the other.
+pad1 = -1
+pad2 = -2
+
+# The most cells of a code point matrix, and the most pairs, handled in one
+# chunk.
+chunk_cells = 1 << 22
+max_chunk = 1 << 16
+
+def encode(strings, width, pad):
+    """Return a matrix of the code points of 'strings', one string per row,
+    padded out to 'width' with 'pad', and an array of the string lengths."""
+    lengths = np.fromiter(map(len, strings), np.int64, len(strings))
+    codes = np.full((len(strings), width), pad, np.int32)
+    text = ''.join(strings).encode('utf-32-le', 'surrogatepass')
+    codes[np.arange(width) < lengths[:, None]] = np.frombuffer(text,
+                                                                   np.uint32)
+    return codes, lengths
+
+def count_matches(codes1, codes2, len1, len2):
+    """The vectorised count_matches(): for each row, s1 (in codes1) must be
+    no longer than s2. Returns the number of matches and the boolean flag
+    matrices."""
+    num_rows, width1 = codes1.shape
+    width2 = codes2.shape[1]
+    rows = np.arange(num_rows)
+    cols = np.arange(width2)
+    search_range = np.maximum(len2//2 - 1, 0)
+    max_range = int(search_range.max())
+    flags1 = np.zeros(codes1.shape, bool)
+    flags2 = np.zeros(codes2.shape, bool)
+
+    # Each char of s1 takes the first unmatched, equal char of s2 within the
+    # search range - for every row at once. The padding never matches. Only
+    # the columns within the widest search range are looked at.
+    for i in range(width1):
+        lo = max(i - max_range, 0)
+        hi = min(i + max_range + 1, width2)
+        window = cols[lo:hi]
+        lolim = i - search_range
+        hilim = i + search_range
+        found = ((codes2[:, lo:hi] == codes1[:, i, None]) & ~flags2[:, lo:hi]
+                    & (window >= lolim[:, None]) & (window <= hilim[:, None]))
+        j = found.argmax(axis=1)
+        matched = found[rows, j]
+        flags1[:, i] = matched
+        flags2[rows[matched], lo + j[matched]] = True
+
+    return flags1.sum(axis=1), flags1, flags2
+
+def count_half_transpositions(codes1, codes2, flags1, flags2, num_matches):
+    """The vectorised count_half_transpositions(): line up the matched chars
+    of each string by their rank, and count the pairs which differ."""
+    num_rows, width1 = codes1.shape
+    matched1 = np.full(codes1.shape, pad1, np.int32)
+    matched2 = np.full(codes1.shape, pad2, np.int32)
+    for flags, codes, matched in [(flags1, codes1, matched1),
+                                  (flags2, codes2, matched2)]:
+        rows, cols = np.nonzero(flags)
+        ranks = np.cumsum(flags, axis=1)[rows, cols] - 1
+        matched[rows, ranks] = codes[rows, cols]
+    in_use = np.arange(width1) < num_matches[:, None]
+    return ((matched1 != matched2) & in_use).sum(axis=1)
+
+def typo_ids(typo_table):
+    """Number the chars of 'typo_table' from 1, and return a lookup array
+    from code points to ids (0 for chars not in the table), and matrices of
+    which pairs of ids are similar, and the score for each."""
+    chars = set(typo_table.rows)
+    chars.update(typo_table.cols)
+    chars = sorted(char for char in chars if len(char) == 1)
+    ids = dict((char, i + 1) for i, char in enumerate(chars))
+    # The last entry is for every code point beyond those in the table.
+    lookup = np.zeros(max([ord(char) for char in chars] or [0]) + 2, np.int64)
+    for char, id in ids.items():
+        lookup[ord(char)] = id
+    similar = np.zeros((len(chars) + 1,) * 2, bool)
+    scores = np.zeros((len(chars) + 1,) * 2)
+    for row, typo_row in typo_table.rows.items():
+        for col, score in typo_row.items():
+            if row in ids and col in ids:
+                similar[ids[row], ids[col]] = True
+                scores[ids[row], ids[col]] = score
+    return lookup, similar, scores
+
+def to_ids(codes, lookup):
+    "Replace each code point with its typo id, or 0 if it has none."
+    # The padding turns into huge numbers, which are out of the table too.
+    codes = np.minimum(codes.view(np.uint32), len(lookup) - 1)
+    return lookup[codes]
+
+def count_typos(codes1, codes2, len1, flags1, flags2, num_matches, typo_info):
+    """The vectorised count_typos(): each unmatched char of s1 takes the
+    first similar char of s2 which is neither matched nor already taken by
+    an earlier typo. The scores are added up in the same order."""
+    lookup, similar, scores = typo_info
+    ids1 = to_ids(codes1, lookup)
+    ids2 = to_ids(codes2, lookup)
+    free2 = ~flags2
+    typo_score = np.zeros(len(codes1))
+    todo = (num_matches > 0) & (num_matches < len1)
+
+    for i in range(codes1.shape[1]):
+        rows = np.nonzero(todo & ~flags1[:, i] & (ids1[:, i] > 0))[0]
+        if not len(rows): continue
+        row_ids = ids1[rows, i]
+        found = similar[row_ids[:, None], ids2[rows]] & free2[rows]
+        j = found.argmax(axis=1)
+        typod = found[np.arange(len(rows)), j]
+        rows, j, row_ids = rows[typod], j[typod], row_ids[typod]
+        typo_score[rows] += scores[row_ids, ids2[rows, j]]
+        free2[rows, j] = False
+
+    return typo_score
+
+def count_prefix(codes1, codes2, len1, pre_len):
+    """Count the leading chars (up to 'pre_len') which match and are letters,
+    and note whether the first char of s1 is a letter."""
+    width = max(1, min(pre_len, codes1.shape[1]))
+    head = codes1[:, :width]
+    unique, inverse = np.unique(head, return_inverse=True)
+    alpha = np.array([code >= 0 and chr(code).isalpha() for code in unique],
+                                                                          bool)
+    is_alpha = alpha[inverse.reshape(head.shape)]
+    alike = is_alpha & (head == codes2[:, :width])
+    alike &= np.arange(width) < len1[:, None]
+    pre_matches = np.cumprod(alike, axis=1).sum(axis=1)
+    if not pre_len:
+        pre_matches[:] = 0
+    return pre_matches, is_alpha[:, 0]
+
+def fn_weights(len1, len2, num_matches, half_transposes, typo_score,
+                   all_pre_matches, alpha_start, typo_scale, boost_threshold,
+                       pre_len, pre_scale, longer_prob):
+    """
+    The vectorised fn_custom(): combine the counts for arrays of pairs into
+    their weights, using the parameters of metric_custom().
+
+    'all_pre_matches' may be counted up to any prefix length of at least
+    'pre_len'; 'alpha_start' says whether the first char of s1 is a letter.
+    The calculations of fn_jaro(), fn_winkler() and fn_longer() are done in
+    the same order, so that the results are exactly the same floats."""
+    # Avoid dividing by zero for the null strings and strings with no
+    # matches: their scores get filled in separately.
+    num_pairs = len(len1)
+    no_matches = num_matches == 0
+    safe_len1 = np.where(len1 == 0, 1, len1)
+    safe_matches = np.where(no_matches, 1, num_matches)
+    null_score = np.where((len1 == 0) & (len2 == 0), 1.0, 0.0)
+
+    similar = (typo_score / typo_scale) + num_matches
+    weight = (  similar / safe_len1
+              + similar / len2.clip(1)
+              + (num_matches - half_transposes//2) / safe_matches)
+    weight = np.where(no_matches, null_score, weight / 3)
+
+    pre_matches = np.zeros(num_pairs, np.int64)
+    adjust_long = np.zeros(num_pairs, bool)
+    if boost_threshold:
+        boost = (weight > boost_threshold) & ~no_matches
+        pre_matches = np.where(boost, np.minimum(all_pre_matches, pre_len), 0)
+        if longer_prob:
+            adjust_long = (boost & (len1 > pre_len)
+                            & (num_matches > pre_matches + 1)
+                            & (2 * num_matches >= len1 + pre_matches)
+                            & alpha_start)
+
+    weight = weight + pre_matches * pre_scale * (1.0 - weight)
+    num = num_matches - pre_matches - 1
+    den = len1 + len2 - 2*pre_matches + 2
+    num = (1.0 - weight) * num
+    return np.where(adjust_long, weight + (num / den), weight)
+
+def score_chunk(strings1, strings2, scorer, typo_info):
+    "Score a chunk of pairs, with each of 'strings1' no longer than 'strings2'."
+    width1 = max(1, max(map(len, strings1)))
+    width2 = max(1, max(map(len, strings2)))
+    codes1, len1 = encode(strings1, width1, pad1)
+    codes2, len2 = encode(strings2, width2, pad2)
+
+    num_matches, flags1, flags2 = count_matches(codes1, codes2, len1, len2)
+    half_transposes = count_half_transpositions(codes1, codes2, flags1,
+                                                        flags2, num_matches)
+    typo_score = 0
+    if typo_info is not None:
+        typo_score = count_typos(codes1, codes2, len1, flags1, flags2,
+                                                      num_matches, typo_info)
+    pre_matches, alpha_start = count_prefix(codes1, codes2, len1,
+                                                          scorer.pre_len)
+    return fn_weights(len1, len2, num_matches, half_transposes, typo_score,
+                          pre_matches, alpha_start, *scorer.params()[1:])
+
+def score_pairs(left, right, metric=jaro.metric_jaro_winkler,
+                                                         score_cutoff=None):
+    """
+    Score left[i] against right[i], for every i, returning a NumPy array of
+    float64 scores.
+
+    'left' and 'right' are equal-length sequences of strings, and 'metric'
+    any of the standard metric functions, or a Scorer. Every score is the
+    same as the metric itself would give; scores below 'score_cutoff' (if
+    given) come out as 0.0."""
+    scorer = as_scorer(metric)
+    left = list(left)
+    right = list(right)
+    assert len(left) == len(right)
+
+    typo_info = None
+    if scorer.typo_table:
+        typo_info = typo_ids(scorer.typo_table)
+
+    # As in string_metrics(), the shorter string goes first.
+    triples = list(zip(left, right, [len(string2) < len(string1)
+                                    for string1, string2 in zip(left, right)]))
+    strings1 = [string2 if swap else string1
+                                      for string1, string2, swap in triples]
+    strings2 = [string1 if swap else string2
+                                      for string1, string2, swap in triples]
+
+    num_pairs = len(left)
+    len2 = np.fromiter(map(len, strings2), np.int64, num_pairs)
+    scores = np.empty(num_pairs)
+    start = 0
+    while start < num_pairs:
+        # Keep the matrices to a sensible size, however long the strings.
+        width = max(1, len2[start:start+max_chunk].max())
+        end = start + max(1, min(max_chunk, chunk_cells // width))
+        scores[start:end] = score_chunk(strings1[start:end],
+                                        strings2[start:end], scorer, typo_info)
+        start = end
+
+    if score_cutoff is not None:
+        scores[scores < score_cutoff] = 0.0
+    return scores
@@ -0,0 +1,354 @@
+"""
+Functions for comparing one string against many.
+
+These sit on top of the functions in the jaro.py submodule, and give the same
+scores as the metric_*() functions there - they just avoid doing work which
+can't change the answer."""
+import array
+import collections
+import heapq
+import itertools
+
+from . import jaro
+from .scorer import as_scorer
+
+def extract(query, choices, limit=5, score_cutoff=None,
+                             metric=jaro.metric_jaro_winkler, signatures=None):
+    """
+    Find the choices which best match 'query'.
+
+    'metric' may be any of the standard metric functions, or a Scorer.
+    Returns a list of up to 'limit' (choice, score, index) tuples, best score
+    first, where 'index' is the position of the choice in 'choices'. Choices
+    with equal scores are listed in the order they were given. If
+    'score_cutoff' is given, only choices scoring at least that much are
+    returned. A 'limit' of None returns every choice (above the cutoff).
+
+    Only the best 'limit' choices seen so far are kept, and a choice isn't
+    scored at all if the lengths of the strings alone show it can't beat the
+    worst of them. Otherwise, its score is abandoned as soon as it's clear it
+    can't [see the 'score_cutoff' argument of metric_custom()]. If the
+    signature() of each choice is given, in the sequence 'signatures', most
+    choices with too few chars in common with the query aren't even
+    matched."""
+    assert limit is None or limit > 0
+    scorer = as_scorer(metric)
+    (typo_table, typo_scale, boost_threshold,
+                            pre_len, pre_scale, longer_prob) = scorer.params()
+    score = jaro.query_scorer(query, typo_table, typo_scale,
+                              boost_threshold, pre_len, pre_scale, longer_prob)
+    typo_max = scorer.typo_max
+
+    len_q = len(query)
+    bounds = {}
+    threshold = score_cutoff
+    # Min-heap of (score, -index, choice), so that heap[0] is always the entry
+    # we'd throw out first.
+    heap = []
+
+    for index, choice in enumerate(choices):
+        if threshold is not None:
+            len_c = len(choice)
+            try:
+                bound = bounds[len_c]
+            except KeyError:
+                len1, len2 = min(len_q, len_c), max(len_q, len_c)
+                bounds[len_c] = bound = jaro.fn_length_bound(len1, len2,
+                                    typo_max, typo_scale, boost_threshold,
+                                        pre_len, pre_scale, longer_prob)
+            if bound < threshold: continue
+
+        if signatures is None:
+            weight = score(choice, threshold)
+        else:
+            weight = score(choice, threshold, signatures[index])
+        if score_cutoff is not None and weight < score_cutoff: continue
+
+        entry = (weight, -index, choice)
+        if limit is None or len(heap) < limit:
+            heapq.heappush(heap, entry)
+            if limit is not None and len(heap) == limit:
+                threshold = heap[0][0]
+        elif weight > heap[0][0]:
+            # A later choice with an equal score can never displace an
+            # earlier one, so only a strictly better score gets in.
+            heapq.heapreplace(heap, entry)
+            threshold = heap[0][0]
+
+    heap.sort(key=lambda entry: (-entry[0], -entry[1]))
+    return [(choice, weight, -index) for weight, index, choice in heap]
+
+Dedupe = collections.namedtuple('Dedupe', ['clusters', 'edges'])
+
+def prefix_blocker(length=1):
+    """Return a blocker for dedupe() which puts strings with the same first
+    'length' chars in the same block."""
+    def blocker(string):
+        return (string[:length],)
+    return blocker
+
+def dedupe(strings, threshold, metric=jaro.metric_jaro_winkler, blocker=None):
+    """
+    Group together the strings in 'strings' which match each other.
+
+    Two strings match if they score at least 'threshold' under 'metric' (any
+    of the standard metric functions, or a Scorer), and matches are chained:
+    if a matches b, and b matches c, all three end up in the same cluster.
+
+    Only strings in the same block are compared. 'blocker' is a function
+    taking a string and returning an iterable of keys, and strings sharing a
+    key are in the same block [see prefix_blocker()]. With no blocker, every
+    string is compared with every other.
+
+    Returns a Dedupe tuple of 'clusters', a list giving the cluster number of
+    each string (numbered from 0, in the order the clusters first appear),
+    and 'edges', a list of (index1, index2, score) for each matching pair,
+    with index1 < index2, sorted by index. Only the matches are returned:
+    pairs which were scored but fell below the threshold are dropped.
+
+    Each pair is scored only once. Within a block, the strings are compared
+    from the longest down, and once the lengths alone show the rest can't
+    reach the threshold, they're skipped."""
+    scorer = as_scorer(metric)
+    params = scorer.params()
+    (typo_table, typo_scale, boost_threshold,
+                            pre_len, pre_scale, longer_prob) = params
+    typo_max = scorer.typo_max
+    strings = list(strings)
+    num_strings = len(strings)
+
+    if blocker is None:
+        blocks = [range(num_strings)]
+        overlapping = False
+    else:
+        keyed = collections.defaultdict(list)
+        overlapping = False
+        for index, string in enumerate(strings):
+            # A blocker may give the same key twice (e.g. str.split() on a
+            # repeated word), but a string only goes in each block once.
+            keys = set(blocker(string))
+            for key in keys:
+                keyed[key].append(index)
+            overlapping = overlapping or len(keys) > 1
+        blocks = keyed.values()
+
+    parents = list(range(num_strings))
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    bounds = {}
+    seen = set()
+    edges = []
+    for block in blocks:
+        if len(block) < 2: continue
+        # Longest first, and in the order given for equal lengths.
+        block = sorted(block, key=lambda index: -len(strings[index]))
+        for pos, index1 in enumerate(block):
+            string1 = strings[index1]
+            len1 = len(string1)
+            score = None
+            for index2 in block[pos+1:]:
+                string2 = strings[index2]
+                len2 = len(string2)
+                try:
+                    bound = bounds[len2, len1]
+                except KeyError:
+                    bounds[len2, len1] = bound = jaro.fn_length_bound(len2,
+                                        len1, typo_max, typo_scale,
+                                            boost_threshold, pre_len,
+                                                pre_scale, longer_prob)
+                # The bound only falls as the second string gets shorter.
+                if bound < threshold: break
+
+                pair = (min(index1, index2), max(index1, index2))
+                if overlapping:
+                    if pair in seen: continue
+                    seen.add(pair)
+
+                if score is None:
+                    score = jaro.query_scorer(string1, *params)
+                weight = score(string2, threshold)
+                if weight >= threshold:
+                    edges.append(pair + (weight,))
+                    root1, root2 = find(index1), find(index2)
+                    if root1 != root2:
+                        parents[max(root1, root2)] = min(root1, root2)
+
+    edges.sort()
+    numbers = {}
+    clusters = [numbers.setdefault(find(index), len(numbers))
+                                            for index in range(num_strings)]
+    return Dedupe(clusters, edges)
+
+# Largest values of the quantised types, which a score of 1 maps onto.
+quantise_scale = {'d': None, 'B': 255, 'H': 65535}
+
+def cdist_tile(queries, row_start, choices, col_start, scorer, score_cutoff,
+                                                             triangle, dense):
+    """
+    Score a tile of cdist(): every one of 'queries' against every one of
+    'choices'. The first query and choice are at 'row_start' and 'col_start'
+    of the full lists; if 'triangle', the choice at each position is only
+    scored against the earlier queries.
+
+    If 'dense', returns a list of rows of (unquantised) scores, and (if
+    'triangle') a list of the scores of the same pairs the other way round,
+    for the lower triangle. Otherwise, returns arrays of the rows, columns
+    and scores of the pairs scoring at least 'score_cutoff' (or more than 0,
+    if None)."""
+    params = scorer.params()
+    if dense:
+        tile = []
+        mirror = [] if triangle else None
+    else:
+        rows, cols, scores = [], [], []
+
+    for offset, query in enumerate(queries):
+        row = row_start + offset
+        score = jaro.query_scorer(query, *params)
+        first = 0
+        if triangle:
+            first = max(0, row + 1 - col_start)
+        weights = [score(choice, score_cutoff) for choice in choices[first:]]
+        if dense:
+            tile.append([0.0] * first + weights)
+            if triangle:
+                # Only strings of the same length are ever scored in the
+                # order given, so only they can score differently.
+                mirror.append([0.0] * first +
+                        [scorer(choice, query, score_cutoff)
+                            if len(choice) == len(query) else weight
+                                for choice, weight in zip(choices[first:],
+                                                                  weights)])
+            continue
+        for col, weight in enumerate(weights, col_start + first):
+            if (weight >= score_cutoff if score_cutoff is not None
+                                                              else weight > 0):
+                rows.append(row)
+                cols.append(col)
+                scores.append(weight)
+
+    if dense:
+        return tile, mirror
+    return rows, cols, scores
+
+def cdist(queries, choices, metric=jaro.metric_jaro_winkler, score_cutoff=None,
+              dense=True, typecode='d', workers=1, tile_size=256):
+    """
+    Score every one of 'queries' against every one of 'choices'.
+
+    'metric' may be any of the standard metric functions, or a Scorer.
+    Scores below 'score_cutoff' (if given) count as 0.0.
+
+    If 'dense', returns a list with one array.array of scores per query, of
+    type 'typecode'. That's 'd' for the float scores themselves, or 'B' or
+    'H' to quantise them, rounding each to the nearest of 255 or 65535 steps
+    between 0 and 1.
+
+    Otherwise, returns a sparse (rows, cols, scores) triple of arrays, one
+    entry per pair scoring at least 'score_cutoff' (or more than 0, if it's
+    None), ordered by row and then column. 'typecode' applies to the scores
+    here too.
+
+    If 'choices' is the very same object as 'queries', the dense results are
+    filled in from the upper triangle (and the diagonal, where every string
+    scores 1). Each pair of strings of different lengths is scored just
+    once, as the metrics give it the same score either way round. Strings of
+    the same length are scored in the order given, though, and can score
+    differently [see cache.ScoreCache.score()], so those pairs are scored
+    both ways. The sparse results hold only the pairs with row < column.
+
+    The work is split into tiles of 'tile_size' queries by 'tile_size'
+    choices, which are handed out to 'workers' processes (if more than one).
+    No more than two tiles per worker are in flight at a time."""
+    assert typecode in quantise_scale
+    assert tile_size > 0
+    scorer = as_scorer(metric)
+    triangle = choices is queries
+    queries = list(queries)
+    choices = queries if triangle else list(choices)
+    num_queries = len(queries)
+    num_choices = len(choices)
+    scale = quantise_scale[typecode]
+
+    def quantise(weights):
+        if scale is None:
+            return array.array('d', weights)
+        return array.array(typecode, [int(weight * scale + 0.5)
+                                                        for weight in weights])
+
+    tiles = []
+    for row_start in range(0, num_queries, tile_size):
+        for col_start in range(0, num_choices, tile_size):
+            # The tiles entirely below the diagonal aren't needed.
+            if triangle and col_start + tile_size <= row_start: continue
+            tiles.append((row_start, col_start))
+
+    def tile_args(tile):
+        row_start, col_start = tile
+        return (queries[row_start:row_start+tile_size], row_start,
+                choices[col_start:col_start+tile_size], col_start,
+                scorer, score_cutoff, triangle, dense)
+
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        def results():
+            with ProcessPoolExecutor(workers) as executor:
+                pending = collections.deque()
+                for tile in tiles:
+                    pending.append((tile, executor.submit(cdist_tile,
+                                                          *tile_args(tile))))
+                    if len(pending) >= 2 * workers:
+                        tile, future = pending.popleft()
+                        yield tile, future.result()
+                while pending:
+                    tile, future = pending.popleft()
+                    yield tile, future.result()
+        results = results()
+    else:
+        results = ((tile, cdist_tile(*tile_args(tile))) for tile in tiles)
+
+    if dense:
+        matrix = [array.array(typecode, bytes(array.array(typecode).itemsize
+                                    * num_choices)) for row in queries]
+        top = quantise([1.0])[0]
+        for (row_start, col_start), (tile, mirror) in results:
+            for offset, weights in enumerate(tile):
+                row = row_start + offset
+                end = col_start + len(weights)
+                values = quantise(weights)
+                if triangle:
+                    # Only the part above the diagonal was scored.
+                    first = max(0, row + 1 - col_start)
+                    matrix[row][col_start+first:end] = values[first:]
+                    values = quantise(mirror[offset][first:])
+                    for col, value in enumerate(values, col_start + first):
+                        matrix[col][row] = value
+                else:
+                    matrix[row][col_start:end] = values
+        if triangle:
+            for row in range(num_queries):
+                matrix[row][row] = top
+        return matrix
+
+    # The tiles come back a band of rows at a time: put the pairs in each
+    # band in order, once it's complete.
+    rows, cols, scores = array.array('L'), array.array('L'), array.array('d')
+    def add_band(band):
+        for row, col, weight in sorted(itertools.chain.from_iterable(band)):
+            rows.append(row)
+            cols.append(col)
+            scores.append(weight)
+    band = []
+    band_start = None
+    for (row_start, col_start), tile in results:
+        if row_start != band_start:
+            add_band(band)
+            band = []
+            band_start = row_start
+        band.append(zip(*tile))
+    add_band(band)
+    return rows, cols, quantise(scores)
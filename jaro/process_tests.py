@@ -0,0 +1,772 @@
+import array
+import csv
+
+from . import jaro
+from . import process
+from .scorer import Scorer, as_scorer
+from .engine_tests import random_strings, typo_table3
+
+# The functions in process.py must give the same answers as the brute force
+# approach of scoring every choice with the metric functions.
+
+standard_metrics = [jaro.metric_jaro, jaro.metric_jaro_winkler,
+                    jaro.metric_original]
+
+def brute_extract(scores, choices, limit, score_cutoff):
+    found = []
+    for index, choice in enumerate(choices):
+        weight = scores[index]
+        if score_cutoff is None or weight >= score_cutoff:
+            found.append((choice, weight, index))
+    found.sort(key=lambda t: -t[1])
+    return found[:limit]
+
+def test_extract():
+    choices = random_strings(400, seed=2)
+    queries = random_strings(25, seed=3)
+    for metric in standard_metrics:
+        for query in queries:
+            scores = [metric(query, choice) for choice in choices]
+            for limit in [1, 5, 50, None]:
+                for score_cutoff in [None, 0.0, 0.6, 0.85, 1.0]:
+                    expected = brute_extract(scores, choices,
+                                                         limit, score_cutoff)
+                    found = process.extract(query, choices,
+                                                 limit, score_cutoff, metric)
+                    assert found == expected, (query, limit, score_cutoff)
+
+    scorer = Scorer(typo_table3, 5, 0.5, 3, 0.2, True)
+    for query in queries:
+        scores = [scorer(query, choice) for choice in choices]
+        expected = brute_extract(scores, choices, 10, 0.7)
+        assert process.extract(query, choices, 10, 0.7, scorer) == expected
+        assert scorer.extract(query, choices, 10, 0.7) == expected
+
+    try:
+        process.extract('ABC', choices, metric=len)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError
+
+def test_index():
+    from .index import LengthIndex
+
+    choices = random_strings(400, seed=17, max_len=30) + ['', '']
+    queries = random_strings(20, seed=18, max_len=30) + ['']
+    index = LengthIndex(choices)
+    signed = LengthIndex(choices, signatures=True)
+    assert len(index) == len(choices)
+    assert sum(map(len, index.buckets.values())) == len(choices)
+    assert index.signatures is None and len(signed.signatures) == len(choices)
+    scorer = Scorer(typo_table3, 5, 0.5, 3, 0.2, True)
+    for metric in standard_metrics + [scorer]:
+        for query in queries:
+            scores = [metric(query, choice) for choice in choices]
+            for score_cutoff in [None, 0.0, 0.7, 0.9, 1.0]:
+                for limit in [1, 5, None]:
+                    expected = brute_extract(scores, choices, limit,
+                                                                score_cutoff)
+                    assert index.extract(query, limit, score_cutoff,
+                                                         metric) == expected
+                    assert signed.extract(query, limit, score_cutoff,
+                                                         metric) == expected
+                if score_cutoff is None: continue
+                assert signed.search(query, score_cutoff, metric) == \
+                       brute_extract(scores, choices, None, score_cutoff)
+                candidates = index.candidates(query, score_cutoff, metric)
+                assert candidates == sorted(set(candidates))
+                assert set(candidates) >= set(i for i, weight in
+                            enumerate(scores) if weight >= score_cutoff)
+
+    # At a high threshold, most of the lengths are never looked at.
+    candidates = index.candidates('MARTHA', 0.9, jaro.metric_jaro)
+    assert 0 < len(candidates) < len(choices) / 4
+    assert index.candidates('', 0.5) == [i for i, choice in enumerate(choices)
+                                                                if not choice]
+    assert LengthIndex([]).search('MARTHA', 0.5) == []
+
+def test_corpus():
+    import pickle
+    from .corpus import Corpus
+
+    strings = random_strings(300, seed=19) + ['', 'Z\u00e9ro', '']
+    wide = strings + ['\u4e2d\u6587A', '\U0001f600AB', '\ud800A']
+    for these in [strings, wide]:
+        for signatures in [False, True]:
+            corpus = Corpus(these[:50], signatures)
+            corpus.extend(these[50:])
+            assert len(corpus) == len(these)
+            assert list(corpus) == these
+            assert [corpus[i] for i in range(-3, 3)] == these[-3:] + these[:3]
+            assert [corpus.length(i) for i in range(len(these))] == \
+                                                        list(map(len, these))
+            assert (corpus.signatures is None) != signatures
+            copy = pickle.loads(pickle.dumps(corpus))
+            assert list(copy) == these and copy.typecode == corpus.typecode
+
+            for metric in [jaro.metric_jaro_winkler, jaro.metric_original]:
+                for query in ['MARTHA', 'Zero', '\u4e2dAB', '']:
+                    assert corpus.batch(query, metric, 0.7) == [
+                                metric(query, s, 0.7) for s in these]
+                    for limit, cutoff in [(5, None), (3, 0.6), (None, 0.8)]:
+                        assert copy.extract(query, limit, cutoff, metric) == \
+                            process.extract(query, these, limit, cutoff, metric)
+                    assert corpus.search(query, 0.8, metric) == \
+                           process.extract(query, these, None, 0.8, metric)
+    assert Corpus(['abc', 'Z\u00e9ro']).typecode == 'B'
+    assert Corpus(wide).typecode != 'H'
+    assert Corpus(['\u4e2d']).typecode == 'H'
+    try:
+        Corpus(strings)[len(strings)]
+    except IndexError:
+        pass
+    else:
+        raise AssertionError
+
+def test_index_file():
+    import os
+    import pickle
+    import shutil
+    import tempfile
+    from . import index_file
+    from .corpus import Corpus
+
+    strings = random_strings(300, seed=20, max_len=20) + ['', '\U0001f600A']
+    blocker = process.prefix_blocker(1)
+    tempdir = tempfile.mkdtemp()
+    path = os.path.join(tempdir, 'strings.idx')
+    try:
+        for these, signatures, keys, expected, signed in [
+                (strings, True, blocker, strings, True),
+                (Corpus(strings[:100]), True, None, strings[:100], False),
+                (iter(strings), False, blocker, strings, False),
+                ([], True, None, [], True)]:
+            index_file.save(path, these, keys, signatures)
+            these = expected
+            with index_file.open(path, verify=True) as mapped:
+                assert len(mapped) == len(these)
+                assert list(mapped.corpus) == these
+                assert (mapped.corpus.signatures is not None) == signed
+                for query in ['MARTHA', 'ABCA', '']:
+                    for limit, cutoff in [(5, None), (3, 0.6), (None, 0.8)]:
+                        assert mapped.extract(query, limit, cutoff,
+                                                  jaro.metric_original) == \
+                               process.extract(query, these, limit, cutoff,
+                                                         jaro.metric_original)
+                blocks = {}
+                if keys is not None:
+                    blocks = index_file.block_index(keys, these)
+                assert list(mapped.keys) == sorted(blocks)
+                for key in sorted(blocks) + ['?']:
+                    assert list(mapped.block(key)) == blocks.get(key, [])
+
+                copy = pickle.loads(pickle.dumps(mapped))
+                assert copy.search('ABC', 0.7) == mapped.search('ABC', 0.7)
+                copy.close()
+
+        # Damage is found: in the header always, in the data if verifying.
+        index_file.save(path, strings, blocker)
+        with open(path, 'rb') as f:
+            data = f.read()
+        for position, verify, message in [(0, False, 'Not an index'),
+                                          (8, False, 'version'),
+                                          (30, False, 'header is corrupt'),
+                                          (len(data) - 3, True, 'corrupt')]:
+            damaged = bytearray(data)
+            damaged[position] ^= 0xff
+            with open(path, 'wb') as f:
+                f.write(damaged)
+            try:
+                index_file.open(path, verify)
+            except ValueError as e:
+                assert message in str(e), (position, e)
+            else:
+                raise AssertionError(position)
+        index_file.open(path).close()
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_cdist():
+    queries = random_strings(45, seed=15)
+    choices = random_strings(60, seed=16) + ['']
+    for metric in standard_metrics + [Scorer(typo_table3, 3)]:
+        for score_cutoff in [None, 0.0, 0.8]:
+            for same in [False, True]:
+                these = queries if same else choices
+                expected = [[metric(query, choice) for choice in these]
+                                                        for query in queries]
+                if score_cutoff is not None:
+                    expected = [[weight if weight >= score_cutoff else 0.0
+                                    for weight in row] for row in expected]
+
+                for tile_size, workers in [(7, 1), (16, 2), (1000, 1)]:
+                    found = process.cdist(queries, these, metric,
+                               score_cutoff, True, 'd', workers, tile_size)
+                    assert [list(row) for row in found] == expected
+                    for typecode, scale in [('B', 255), ('H', 65535)]:
+                        found = process.cdist(queries, these, metric,
+                                   score_cutoff, True, typecode, workers,
+                                       tile_size)
+                        assert all(row.typecode == typecode for row in found)
+                        assert [list(row) for row in found] == \
+                                [[int(weight * scale + 0.5) for weight in row]
+                                                        for row in expected]
+
+                    sparse = [(row, col, weight)
+                                for row, weights in enumerate(expected)
+                                    for col, weight in enumerate(weights)
+                                        if (weight > 0 if score_cutoff is None
+                                            else weight >= score_cutoff)
+                                        and not (same and col <= row)]
+                    rows, cols, scores = process.cdist(queries, these, metric,
+                                            score_cutoff, False, 'd', workers,
+                                                tile_size)
+                    assert list(zip(rows, cols, scores)) == sparse
+
+    # Strings of the same length can score differently either way round, so
+    # the lower triangle can't simply mirror the upper one.
+    pair = ['0L0QAJ', 'Q10QLJ']
+    expected = [[jaro.metric_original(s1, s2) for s2 in pair] for s1 in pair]
+    assert expected[0][1] != expected[1][0]
+    for these in [pair, list(pair)]:
+        found = process.cdist(pair, these, jaro.metric_original)
+        assert [list(row) for row in found] == expected
+
+    assert process.cdist([], ['a']) == []
+    assert process.cdist(['a'], []) == [array.array('d')]
+    assert [list(a) for a in process.cdist([], [], dense=False)] == [[]] * 3
+
+def test_bounds():
+    strings = random_strings(300, seed=4)
+    for metric in standard_metrics:
+        params = jaro.metric_params[metric]
+        typo_max = jaro.max_typo_score(params[0])
+        for s1 in strings[:30]:
+            for s2 in strings:
+                len1, len2 = sorted([len(s1), len(s2)])
+                bound = jaro.fn_length_bound(len1, len2, typo_max, *params[1:])
+                assert metric(s1, s2) <= bound
+
+def have_numpy():
+    try:
+        import numpy
+    except ImportError:
+        print('NumPy not installed - skipping test.')
+        return False
+    return True
+
+def test_sweep():
+    from . import sweep
+    from .engine_tests import test_pairs, long_pairs, custom_params
+
+    if not have_numpy(): return
+    pairs = test_pairs() + long_pairs(10)
+    configs = standard_metrics + [Scorer(*params) for params in custom_params]
+    configs += [jaro.params_original, custom_params[1], custom_params[1]]
+    scorers = sweep.make_scorers(configs)
+    assert scorers[-1].typo_table is scorers[-2].typo_table
+
+    scores = sweep.sweep(pairs, configs)
+    assert scores.shape == (len(pairs), len(configs))
+    for i, (s1, s2) in enumerate(pairs):
+        expected = [scorer(s1, s2) for scorer in scorers]
+        assert scores[i].tolist() == expected, (s1, s2)
+
+    assert sweep.sweep([], configs).shape == (0, len(configs))
+
+def test_np_engine():
+    if not have_numpy():
+        print('NumPy not installed: skipping the tests of np_engine.py')
+        return
+    from . import np_engine
+    from .engine_tests import test_pairs, long_pairs, custom_params
+
+    pairs = test_pairs() + long_pairs(30)
+    pairs.append(('\ud800abc', 'abc\ud800'))
+    left = [s1 for s1, s2 in pairs]
+    right = [s2 for s1, s2 in pairs]
+    scorers = standard_metrics + [Scorer(*params) for params in custom_params]
+    for metric in scorers:
+        expected = [metric(s1, s2) for s1, s2 in pairs]
+        found = np_engine.score_pairs(left, right, metric)
+        assert found.dtype.name == 'float64'
+        assert list(found) == expected, metric
+
+        # Small chunks, each with its own widths, give the same answers.
+        cells = np_engine.chunk_cells
+        try:
+            np_engine.chunk_cells = 300
+            assert list(np_engine.score_pairs(left, right, metric)) == expected
+        finally:
+            np_engine.chunk_cells = cells
+
+        cutoff = [weight if weight >= 0.8 else 0.0 for weight in expected]
+        assert list(np_engine.score_pairs(left, right, metric, 0.8)) == cutoff
+
+    assert len(np_engine.score_pairs([], [])) == 0
+
+def test_cache():
+    import threading
+    from .cache import ScoreCache, cached_metric
+
+    strings = random_strings(60, seed=8)
+    metric = cached_metric(jaro.metric_original, maxsize=10000)
+    for s1 in strings:
+        for s2 in strings:
+            assert metric(s1, s2) == jaro.metric_original(s1, s2)
+            assert metric(s1, s2, 0.9) == jaro.metric_original(s1, s2, 0.9)
+    stats = metric.cache.stats()
+    # Every pair was scored once - just once, either way round, for strings
+    # of different lengths; all the other calls were hits.
+    num_pairs = len(set((s1, s2) if len(s1) == len(s2) else
+                            frozenset([s1, s2]) for s1 in strings
+                                                        for s2 in strings))
+    assert stats.misses == stats.entries == num_pairs
+    assert stats.hits == 2 * len(strings)**2 - num_pairs
+    assert stats.evictions == 0
+
+    # Strings of equal length can score differently either way round, and
+    # the cache mustn't hide that, whichever order it sees first.
+    for first, second in [('0L0QAJ', 'Q10QLJ'), ('Q10QLJ', '0L0QAJ')]:
+        metric = cached_metric(jaro.metric_original)
+        for s1, s2 in [(first, second), (second, first)] * 2:
+            assert metric(s1, s2) == jaro.metric_original(s1, s2)
+        assert metric.cache.stats()[:2] == (2, 2)
+    assert jaro.metric_original('0L0QAJ', 'Q10QLJ') != \
+                                    jaro.metric_original('Q10QLJ', '0L0QAJ')
+
+    # Different metrics don't share entries.
+    cache = ScoreCache(maxsize=3)
+    assert cache.score(jaro.metric_jaro, 'MARTHA', 'MARHTA') == \
+                                        jaro.metric_jaro('MARTHA', 'MARHTA')
+    assert cache.score(jaro.metric_jaro_winkler, 'MARHTA', 'MARTHA') == \
+                                jaro.metric_jaro_winkler('MARTHA', 'MARHTA')
+    assert cache.stats()[:3] == (0, 2, 0)
+    cache.score(jaro.metric_jaro, 'MARTHA', 'MARHTA')
+    cache.score(jaro.metric_jaro, 'A', 'B')
+    cache.score(jaro.metric_jaro, 'A', 'C')
+    assert cache.stats()[:4] == (1, 4, 1, 3)
+    # The Jaro-Winkler entry was the least recently used.
+    cache.score(jaro.metric_jaro_winkler, 'MARHTA', 'MARTHA')
+    assert cache.stats()[:4] == (1, 5, 2, 3)
+
+    cache = ScoreCache(maxsize=None, maxbytes=2000)
+    for s in strings:
+        cache.score(jaro.metric_jaro, s, 'ABC')
+    stats = cache.stats()
+    assert 0 < stats.size_bytes <= 2000 and stats.evictions > 0
+
+    # Byte strings are cached too, but unhashable ones are refused up front.
+    cache = ScoreCache()
+    assert cache.score(jaro.metric_jaro, b'MARTHA', b'MARHTA') == \
+                                        jaro.metric_jaro('MARTHA', 'MARHTA')
+    for string in [bytearray(b'MARTHA'), memoryview(b'MARTHA')]:
+        try:
+            cache.score(jaro.metric_jaro, string, b'MARHTA')
+        except AssertionError as e:
+            assert 'str or bytes' in str(e)
+        else:
+            assert False
+
+    metric = cached_metric(jaro.metric_jaro_winkler, maxsize=500)
+    errors = []
+    def work():
+        try:
+            for s1 in strings:
+                for s2 in strings[:20]:
+                    assert metric(s1, s2) == jaro.metric_jaro_winkler(s1, s2)
+        except AssertionError as e:
+            errors.append(e)
+    threads = [threading.Thread(target=work) for i in range(4)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert not errors
+    assert metric.cache.stats().entries <= 500
+
+def brute_dedupe(strings, threshold, metric, keys):
+    edges = []
+    for index1 in range(len(strings)):
+        for index2 in range(index1+1, len(strings)):
+            if not (keys[index1] & keys[index2]): continue
+            weight = metric(strings[index1], strings[index2])
+            if weight >= threshold:
+                edges.append((index1, index2, weight))
+    # Cluster by flood fill, rather than union-find.
+    neighbours = [[] for string in strings]
+    for index1, index2, weight in edges:
+        neighbours[index1].append(index2)
+        neighbours[index2].append(index1)
+    clusters = [None] * len(strings)
+    number = 0
+    for start in range(len(strings)):
+        if clusters[start] is not None: continue
+        todo = [start]
+        while todo:
+            index = todo.pop()
+            if clusters[index] is None:
+                clusters[index] = number
+                todo.extend(neighbours[index])
+        number += 1
+    return clusters, edges
+
+def test_dedupe():
+    strings = random_strings(150, seed=10)
+    # Some near duplicates, so that there are clusters to find.
+    strings += [s[:-1] + 'x' for s in strings[:40] if len(s) > 3]
+    strings += strings[:10]
+    one_key = lambda s: {None}
+    first = lambda s: {s[:1]}
+    first_or_last = lambda s: {'<' + s[:1], '>' + s[-1:]}
+    scorers = standard_metrics + [Scorer(typo_table3, 3)]
+    for metric in scorers:
+        for threshold in [0.7, 0.85, 0.95]:
+            for blocker, keys in [(None, one_key),
+                                  (process.prefix_blocker(1), first),
+                                  (lambda s: sorted(first_or_last(s)),
+                                                            first_or_last)]:
+                expected = brute_dedupe(strings, threshold, metric,
+                                                [keys(s) for s in strings])
+                found = process.dedupe(strings, threshold, metric, blocker)
+                assert tuple(found) == expected, (metric, threshold)
+
+    assert process.dedupe([], 0.8) == ([], [])
+    clusters, edges = process.dedupe(['MARTHA', 'MARHTA', 'JONES', 'MARTHA'],
+                                                                        0.9)
+    assert clusters == [0, 0, 1, 0]
+    assert [edge[:2] for edge in edges] == [(0, 1), (0, 3), (1, 3)]
+
+    # A blocker giving the same key twice doesn't pair a string with itself.
+    names = ['JOHN SMITH', 'SMITH SMITH', 'JON SMYTH', 'SMITH JOHN SMITH']
+    found = process.dedupe(names, 0.8, blocker=str.split)
+    assert all(index1 < index2 for index1, index2, weight in found.edges)
+    assert tuple(found) == brute_dedupe(names, 0.8, jaro.metric_jaro_winkler,
+                                          [set(name.split()) for name in names])
+    assert process.dedupe(['SMITH SMITH'], 0.8, blocker=str.split) == \
+                                                                    ([0], [])
+
+def test_link():
+    import os
+    import shutil
+    import tempfile
+    from . import linkage
+
+    left = random_strings(200, seed=11)
+    right = random_strings(120, seed=12)
+    right += [s[:-1] + 'x' for s in left[:60] if len(s) > 3]
+    first_or_last = lambda s: {'<' + s[:1], '>' + s[-1:]}
+
+    def expected_rows(metric, threshold, keys):
+        rows = set()
+        for index1, string1 in enumerate(left):
+            for index2, string2 in enumerate(right):
+                if not (keys(string1) & keys(string2)): continue
+                weight = metric(string1, string2)
+                if weight >= threshold:
+                    rows.add((str(index1), str(index2), string1, string2,
+                                                                repr(weight)))
+        return rows
+
+    def read_rows(path):
+        with open(path, newline='', encoding='utf8') as f:
+            rows = [tuple(row) for row in csv.reader(f, delimiter='\t')]
+        assert len(rows) == len(set(rows))
+        return set(rows)
+
+    tempdir = tempfile.mkdtemp()
+    output = os.path.join(tempdir, 'matches.tsv')
+    try:
+        for metric, threshold, blocker, keys in [
+                (jaro.metric_original, 0.8, None, lambda s: {s[:1]}),
+                (jaro.metric_jaro, 0.7, first_or_last, first_or_last)]:
+            expected = expected_rows(metric, threshold, keys)
+            assert expected
+            found = linkage.link(iter(left), iter(right), output, threshold,
+                                      metric, blocker, num_buckets=7)
+            assert found == len(expected)
+            assert read_rows(output) == expected
+            assert os.listdir(tempdir) == ['matches.tsv']
+
+            # Kill the job part way through a bucket, then resume it.
+            match_bucket = linkage.match_bucket
+            calls = [0]
+            def dying_match_bucket(workdir, number, scorer, threshold,
+                                                          blocker, writer):
+                calls[0] += 1
+                if calls[0] == 4:
+                    writer.writerow(['half', 'written'])
+                    raise KeyboardInterrupt
+                return match_bucket(workdir, number, scorer, threshold,
+                                                            blocker, writer)
+            linkage.match_bucket = dying_match_bucket
+            try:
+                linkage.link(iter(left), iter(right), output, threshold,
+                                        metric, blocker, num_buckets=7)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                linkage.match_bucket = match_bucket
+            assert os.path.exists(output + '.checkpoint')
+
+            try:
+                linkage.link(iter(left), iter(right), output, threshold,
+                                        metric, blocker, num_buckets=8)
+            except ValueError:
+                pass
+            else:
+                assert False, 'Expected a ValueError'
+
+            # Both sides have been partitioned already, so aren't read.
+            found = linkage.link(iter([]), None, output, threshold,
+                                     metric, blocker, num_buckets=7)
+            assert found == len(expected)
+            assert read_rows(output) == expected
+            assert os.listdir(tempdir) == ['matches.tsv']
+    finally:
+        shutil.rmtree(tempdir)
+
+def test_aio():
+    import asyncio
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+    from . import aio
+
+    choices = random_strings(500, seed=13)
+    queries = random_strings(4, seed=14)
+    scorers = standard_metrics + [Scorer(typo_table3, 3, 0.7, 4, 0.1)]
+
+    async def check(executor, limiter=None):
+        for metric in scorers:
+            scorer = as_scorer(metric)
+            for query in queries:
+                for score_cutoff in [None, 0.8]:
+                    expected = scorer.batch(query, choices, score_cutoff)
+                    found = await aio.batch(query, choices, metric,
+                                     score_cutoff, 64, executor, limiter)
+                    assert found == expected
+                    for limit in [1, 5, None]:
+                        expected = process.extract(query, choices, limit,
+                                                        score_cutoff, metric)
+                        found = await aio.extract(query, choices, limit,
+                                        score_cutoff, metric, 64, executor,
+                                            limiter)
+                        assert found == expected
+        assert await aio.batch('a', []) == []
+        assert await aio.extract('a', []) == []
+
+    asyncio.run(check(None))
+    asyncio.run(check(None, asyncio.Semaphore(1)))
+    with ProcessPoolExecutor(2) as executor:
+        asyncio.run(check(executor))
+
+    # Many concurrent calls share the limiter, the event loop keeps running
+    # while they're scored, and a cancelled call starts no more chunks.
+    async def concurrent():
+        limiter = asyncio.Semaphore(2)
+        ticks = [0]
+        async def ticker():
+            while True:
+                ticks[0] += 1
+                await asyncio.sleep(0)
+        tick_task = asyncio.ensure_future(ticker())
+        calls = [aio.batch(query, choices, chunk_size=50, limiter=limiter)
+                                                        for query in queries]
+        results = await asyncio.gather(*calls)
+        assert results == [jaro.metric_jaro_winkler_batch(query, choices)
+                                                        for query in queries]
+        assert ticks[0] > len(queries) * len(choices) // 50
+
+        task = asyncio.ensure_future(aio.batch(queries[0], choices * 50,
+                                        chunk_size=50, limiter=limiter))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        start = time.perf_counter()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        else:
+            assert False, 'Expected the call to be cancelled'
+        assert time.perf_counter() - start < 1
+        tick_task.cancel()
+
+    asyncio.run(concurrent())
+
+def test_bench():
+    from . import bench
+
+    # The benchmark strings must be the same every time, so that runs can
+    # be compared.
+    for ratio in bench.ratios:
+        query, choices = bench.make_strings(30, ratio, 'unicode', 10, 1)
+        assert (query, choices) == bench.make_strings(30, ratio, 'unicode',
+                                                                      10, 1)
+        assert len(query) == 30 and len(choices) == 10
+        assert all(len(choice) == 30 for choice in choices)
+        if ratio == 'identical':
+            assert choices == [query] * 10
+        if ratio == 'near_miss':
+            assert all(0.8 < jaro.metric_jaro(query, choice) < 1
+                                                    for choice in choices)
+
+    results = bench.run(list(bench.metrics), [3, 40], ['near_miss'],
+                            ['mixed'], bench.styles, repeat=1, scale=0.01)
+    # No batch function for strcmp95.
+    assert len(results) == 2 * (2 * len(bench.metrics) - 1)
+    for result in results:
+        assert result['pairs_per_sec'] > 0
+        assert result['p50_us'] <= result['p90_us'] <= result['p99_us']
+
+    slower = [dict(result, pairs_per_sec=result['pairs_per_sec'] / 2)
+                                                    for result in results]
+    changes, regressions = bench.compare(results, slower)
+    assert len(changes) == len(results) and not regressions
+    changes, regressions = bench.compare(slower, results[1:], 0.4)
+    assert len(changes) == len(regressions) == len(results) - 1
+
+def test_cli():
+    import io
+    import os
+    import sys
+    import tempfile
+    from . import cli
+
+    pairs = list(zip(random_strings(60, seed=8), random_strings(60, seed=9)))
+    handle, path = tempfile.mkstemp(suffix='.tsv')
+    with os.fdopen(handle, 'w', encoding='utf8') as f:
+        for s1, s2 in pairs:
+            f.write('%s\t%s\n' % (s1, s2))
+
+    outputs = []
+    def run(*argv, **kwargs):
+        stdin, stdout, stderr = sys.stdin, sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = io.StringIO(), io.StringIO()
+        if 'stdin' in kwargs:
+            sys.stdin = io.TextIOWrapper(io.BytesIO(kwargs['stdin']))
+        try:
+            cli.main([kwargs.get('path', path)] + list(argv))
+            return [line.split('\t') for line in
+                                        sys.stdout.getvalue().splitlines()]
+        finally:
+            outputs.append((sys.stdout.getvalue(), sys.stderr.getvalue()))
+            sys.stdin, sys.stdout, sys.stderr = stdin, stdout, stderr
+
+    def fails(*argv, **kwargs):
+        "Check that the command exits with an error, not a traceback."
+        try:
+            run(*argv, **kwargs)
+        except SystemExit as e:
+            assert e.code
+            return outputs[-1][1] + str(e.code)
+        assert False
+
+    try:
+        for name, metric in [('jaro', jaro.metric_jaro),
+                             ('jaro_winkler', jaro.metric_jaro_winkler),
+                             ('original', jaro.metric_original)]:
+            expected = [[s1, s2, repr(metric(s1, s2))] for s1, s2 in pairs]
+            assert run('--metric', name) == expected
+            assert run('--metric', name, '--workers', '2',
+                                        '--chunk-size', '7') == expected
+            kept = [row for row in expected if float(row[2]) >= 0.8]
+            assert run('--metric', name, '--threshold', '0.8') == kept
+
+        custom = run('--metric', 'custom', '--typo-table', 'original',
+                     '--typo-scale', '10', '--boost-threshold', '0.7',
+                     '--pre-len', '4', '--pre-scale', '0.1', '--longer-prob')
+        assert custom == run('--metric', 'original')
+
+        # Stdin is read like a file, so quoted fields may hold newlines.
+        scored = run('--format', 'csv', path='-',
+                     stdin=b'MARTHA,MARHTA\r\n"A\r\nB",AB\r\n')
+        assert scored == [['MARTHA,MARHTA,%r' % jaro.metric_jaro_winkler(
+                                                        'MARTHA', 'MARHTA')],
+                          ['"A'],
+                          ['B",AB,%r' % jaro.metric_jaro_winkler('A\r\nB',
+                                                                      'AB')]]
+
+        assert 'invalid custom metric' in fails('--metric', 'custom',
+                                                '--pre-scale', '2')
+        assert 'invalid custom metric' in fails('--metric', 'custom',
+                        '--boost-threshold', '0.5', '--pre-len', '10',
+                            '--pre-scale', '0.5')
+
+        # The pairs before a bad line are still scored and written out.
+        for chunk_size in ['1', '1000']:
+            assert 'line 3: expected two strings' in fails(
+                                        '--chunk-size', chunk_size, path='-',
+                                            stdin=b'A\tB\nC\tD\nX\nE\tF\n')
+            assert outputs[-1][0] == 'A\tB\t0.0\nC\tD\t0.0\n'
+    finally:
+        os.remove(path)
+
+def test_normalise():
+    import pickle
+    from .normalise import Normaliser, normalised_metric
+
+    normalise = Normaliser(maxsize=4)
+    assert normalise('  Zoë Saldaña ') == 'ZOE SALDANA'
+    assert normalise("O'Brien-Smith, Jr.") == 'OBRIENSMITH JR'
+    assert normalise('«Ｆｉｎｎ»') == 'FINN'
+    assert normalise('straße') == 'STRASSE'
+    assert Normaliser(case='casefold')('Straße') == 'strasse'
+    assert Normaliser(False, None, False, False)(' Zoë! ') == ' Zoë! '
+    # Symbols aren't punctuation.
+    assert normalise('A+B $5') == 'A+B $5'
+
+    normalise.cache_clear()
+    for string in ['a', 'b', 'a', 'a', 'c', 'd', 'e', 'b']:
+        normalise(string)
+    info = normalise.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (2, 6, 4)
+
+    copy = pickle.loads(pickle.dumps(normalise))
+    assert copy == normalise and hash(copy) == hash(normalise)
+    assert copy != Normaliser(case='lower')
+    assert copy.cache_info().currsize == 0
+
+    strings = [string.upper().strip()
+                        for string in random_strings(100, seed=9)]
+    choices = [' %s. ' % string.lower() for string in strings]
+    metric = normalised_metric(jaro.metric_original)
+    prepared = metric.normaliser.prepare(choices)
+    assert list(prepared) == strings
+    assert prepared.choices == choices
+    for query in ['martha', ' Dixon ', 'AbC', '']:
+        expected = jaro.metric_original_batch(query.upper().strip(), strings)
+        assert metric.batch(query, choices) == expected
+        assert metric.batch(query, prepared) == expected
+        assert [metric(query, choice) for choice in choices] == expected
+
+        found = metric.extract(query, prepared, 5, 0.5)
+        assert found == metric.extract(query, iter(choices), 5, 0.5)
+        assert [(choice, weight, index) for choice, weight, index in found] \
+            == [(choices[index], weight, index) for string, weight, index in
+                    process.extract(query.upper().strip(), strings, 5, 0.5,
+                                                        jaro.metric_original)]
+
+    # Choices prepared by a different Normaliser are normalised again.
+    lower = Normaliser(case='lower').attach(jaro.metric_jaro)
+    assert lower.batch('MARTHA', prepared) == \
+           jaro.metric_jaro_batch('martha', [string.lower()
+                                                      for string in strings])
+
+def test():
+    test_bounds()
+    test_extract()
+    test_index()
+    test_corpus()
+    test_index_file()
+    test_cdist()
+    test_sweep()
+    test_np_engine()
+    test_cache()
+    test_normalise()
+    test_dedupe()
+    test_link()
+    test_aio()
+    test_bench()
+    test_cli()
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,107 @@
+"""
+A reusable, pre-configured version of metric_custom().
+
+If you're going to make a lot of comparisons with the same parameters, build
+a Scorer from them once: the parameters are checked, and the typo table
+compiled, when the Scorer is created, rather than on every comparison."""
+from . import jaro
+from .typo_tables import TypoTable
+
+class Scorer(object):
+    """
+    Calculate the Jaro-Winkler metric with a fixed set of parameters.
+
+    The arguments are those of metric_custom() (which see), and calling the
+    Scorer on two strings gives exactly the same answer as metric_custom()
+    would. The typo table may be given in any form TypoTable accepts.
+
+    Scorers are small, and pickle cheaply - the standard ones (jaro_scorer,
+    jaro_winkler_scorer and original_scorer) by reference."""
+    __slots__ = ('typo_table', 'typo_scale', 'boost_threshold', 'pre_len',
+                 'pre_scale', 'longer_prob', 'typo_max', 'name')
+
+    def __init__(self, typo_table=None, typo_scale=1, boost_threshold=None,
+                 pre_len=0, pre_scale=0, longer_prob=False, name=None):
+        jaro.check_params(typo_scale, boost_threshold, pre_len, pre_scale)
+        if typo_table is not None and not isinstance(typo_table, TypoTable):
+            typo_table = TypoTable(typo_table)
+
+        self.typo_table = typo_table
+        self.typo_scale = typo_scale
+        self.boost_threshold = boost_threshold
+        self.pre_len = pre_len
+        self.pre_scale = pre_scale
+        self.longer_prob = longer_prob
+        self.typo_max = jaro.max_typo_score(typo_table)
+        # Only the standard scorers defined below should be given a name.
+        self.name = name
+
+    def params(self):
+        "The parameters of the Scorer, in the order metric_custom() takes them."
+        return (self.typo_table, self.typo_scale, self.boost_threshold,
+                    self.pre_len, self.pre_scale, self.longer_prob)
+
+    def __call__(self, string1, string2, score_cutoff=None):
+        typo_table = jaro.check_strings(string1, string2, self.typo_table)
+        len1 = len(string1)
+        len2 = len(string2)
+        if len2 < len1:
+            string1, string2 = string2, string1
+            len1, len2 = len2, len1
+
+        ans = jaro.raw_metrics(string1, string2, len1, len2, typo_table,
+                                  self.typo_scale, self.boost_threshold,
+                                      self.pre_len, self.pre_scale,
+                                          self.longer_prob, score_cutoff,
+                                              self.typo_max)
+        weight = jaro.fn_custom(ans, self.typo_scale, self.pre_scale)
+        if score_cutoff is not None and weight < score_cutoff: return 0.0
+        return weight
+
+    def batch(self, query, choices, score_cutoff=None):
+        """Score 'query' against every string in 'choices', returning a list
+        of scores [see metric_custom_batch()]."""
+        score = jaro.query_scorer(query, *self.params())
+        return [score(choice, score_cutoff) for choice in choices]
+
+    def extract(self, query, choices, limit=5, score_cutoff=None):
+        "Find the choices which best match 'query' [see process.extract()]."
+        from . import process
+        return process.extract(query, choices, limit, score_cutoff, self)
+
+    def __reduce__(self):
+        if self.name is not None:
+            return self.name
+        return (Scorer, self.params())
+
+    def __repr__(self):
+        if self.name is not None:
+            return '<Scorer %s>' % self.name
+        return 'Scorer(%r, %r, %r, %r, %r, %r)' % self.params()
+
+jaro_scorer = Scorer(*jaro.params_jaro, name='jaro_scorer')
+jaro_winkler_scorer = Scorer(*jaro.params_jaro_winkler,
+                                                  name='jaro_winkler_scorer')
+original_scorer = Scorer(*jaro.params_original, name='original_scorer')
+
+# The Scorers equivalent to the standard metric functions.
+standard_scorers = {
+    jaro.params_jaro: jaro_scorer,
+    jaro.params_jaro_winkler: jaro_winkler_scorer,
+    jaro.params_original: original_scorer,
+}
+
+def as_scorer(metric):
+    """Return a Scorer for 'metric', which is either a Scorer already, or one
+    of the standard metric functions (metric_jaro(), metric_jaro_winkler() or
+    metric_original(), or their equivalents in the jaro package)."""
+    if isinstance(metric, Scorer):
+        return metric
+    try:
+        params = jaro.metric_params[metric]
+    except (KeyError, TypeError):
+        raise ValueError('Unknown metric: %r' % (metric,))
+    try:
+        return standard_scorers[params]
+    except (KeyError, TypeError):
+        return Scorer(*params)
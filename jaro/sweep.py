@@ -0,0 +1,135 @@
+"""
+Score a set of string pairs under many different metric parameters at once.
+
+When tuning the parameters of metric_custom(), the same pairs get scored
+over and over, though most of the work doesn't depend on the parameters at
+all. sweep() does that work once per pair: the matches and transpositions
+once, the typo score once for each distinct typo table, and the matching
+prefix once. The weights for the whole grid of parameters are then
+calculated from those counts with NumPy, which sweep() needs."""
+from . import jaro
+from .scorer import Scorer, as_scorer
+from .typo_tables import TypoTable
+
+def make_scorers(configs):
+    """Turn 'configs' into a list of Scorers. Each config may be a Scorer, a
+    standard metric function, or a tuple of metric_custom() parameters. Typo
+    tables shared by several configs are only compiled once."""
+    compiled = {}
+    scorers = []
+    for config in configs:
+        if isinstance(config, tuple):
+            typo_table = config[0]
+            if typo_table is not None and not isinstance(typo_table, TypoTable):
+                key = id(typo_table)
+                if key not in compiled:
+                    compiled[key] = TypoTable(typo_table)
+                config = (compiled[key],) + config[1:]
+            scorers.append(Scorer(*config))
+        else:
+            scorers.append(as_scorer(config))
+    return scorers
+
+def pair_counts(s1, s2, typo_tables, pre_len):
+    """
+    Count everything about strings 's1' and 's2' which the parameters of
+    metric_custom() don't affect.
+
+    Returns the lengths, numbers of matches and half transpositions, the typo
+    score for each of 'typo_tables', the number of matching alpha chars in
+    the first 'pre_len' chars of the strings, and whether the first char of
+    the shorter string is a letter."""
+    assert isinstance(s1, str)
+    assert isinstance(s2, str)
+    len1 = len(s1)
+    len2 = len(s2)
+    if len2 < len1:
+        s1, s2 = s2, s1
+        len1, len2 = len2, len1
+
+    no_typos = [0] * len(typo_tables)
+    if not len1:
+        return len1, len2, 0, 0, no_typos, 0, False
+
+    if len2 > jaro.long_threshold:
+        num_matches, flags1, flags2 = jaro.count_matches_long(s1, s2,
+                                                                   len1, len2)
+        if not num_matches:
+            return len1, len2, 0, 0, no_typos, 0, False
+        half_transposes = jaro.count_half_transpositions(s1, s2,
+                                                               flags1, flags2)
+    else:
+        masks2 = jaro.char_masks(s2)
+        num_matches, flags1, flags2 = jaro.count_matches_bits(s1, s2,
+                                                      len1, len2, 0, masks2)
+        if not num_matches:
+            return len1, len2, 0, 0, no_typos, 0, False
+        half_transposes = jaro.count_half_transpositions_bits(s1, s2,
+                                                               flags1, flags2)
+
+    typo_scores = no_typos
+    if len1 > num_matches:
+        typo_scores = []
+        for typo_table in typo_tables:
+            if len2 > jaro.long_threshold:
+                typo_score = jaro.count_typos_long(s1, s2, flags1,
+                                                    list(flags2), typo_table)[0]
+            else:
+                typo_score = jaro.count_typos_bits(s1, s2, flags1, flags2,
+                                                        typo_table, masks2)[0]
+            typo_scores.append(typo_score)
+
+    # The prefix count stops at the first mismatch, so the count for any
+    # shorter 'pre_len' is just this one, capped.
+    pre_matches = 0
+    limit = min(len1, pre_len)
+    while pre_matches < limit:
+        char1 = s1[pre_matches]
+        if not( char1.isalpha() and char1 == s2[pre_matches] ):
+            break
+        pre_matches += 1
+
+    return (len1, len2, num_matches, half_transposes,
+                typo_scores, pre_matches, s1[0].isalpha())
+
+def sweep(pairs, configs):
+    """
+    Score every pair of strings in 'pairs' under every one of 'configs'.
+
+    Each config may be a Scorer, one of the standard metric functions, or a
+    tuple of the parameters to metric_custom(). Returns a NumPy array of
+    shape (number of pairs, number of configs), holding the same scores as
+    calling each config on each pair would."""
+    import numpy as np
+    from .np_engine import fn_weights
+
+    scorers = make_scorers(configs)
+    typo_tables = []
+    for scorer in scorers:
+        if scorer.typo_table is not None and \
+                            not any(t is scorer.typo_table for t in typo_tables):
+            typo_tables.append(scorer.typo_table)
+    pre_len = max([scorer.pre_len for scorer in scorers] or [0])
+
+    counts = [pair_counts(s1, s2, typo_tables, pre_len) for s1, s2 in pairs]
+    num_pairs = len(counts)
+    columns = list(zip(*counts)) or [()] * 7
+    len1, len2, num_matches, half_transposes = [np.array(column, np.int64)
+                                                    for column in columns[:4]]
+    typo_scores = np.array(columns[4], dtype=object).reshape(num_pairs,
+                                                              len(typo_tables))
+    all_pre_matches = np.array(columns[5], np.int64)
+    alpha_start = np.array(columns[6], bool)
+
+    scores = np.empty((num_pairs, len(scorers)))
+    for col, scorer in enumerate(scorers):
+        typo_score = 0
+        if scorer.typo_table is not None:
+            index = [i for i, t in enumerate(typo_tables)
+                                                   if t is scorer.typo_table][0]
+            typo_score = typo_scores[:, index].astype(float)
+        scores[:, col] = fn_weights(len1, len2, num_matches, half_transposes,
+                                        typo_score, all_pre_matches,
+                                            alpha_start, *scorer.params()[1:])
+
+    return scores
@@ -104,7 +104,104 @@ def print_typo_table(typo_table):
     print(' +' + '-'*len(col_chars) + '+')
     print('  ' + col_chars)
 
+class TypoTable(object):
+    """A typo table compiled for fast lookups.
+
+    Build one from either a dictionary of dictionaries (as returned by
+    create_typo_table()) or a square list of lists, indexed by character
+    code, like the 'adjwt' table in the strcmp95.py module (where a score of
+    0 means the characters aren't similar).
+
+    The compiled table can be used wherever a typo table is expected. As
+    well as the rows of the table, it keeps the set of all the characters
+    which appear in any row ('cols'), so that the typo counting functions can
+    ignore every other character of a string up front, and the largest score
+    in the table ('max_score'), needed to decide when a comparison can be
+    abandoned early."""
+    __slots__ = ('rows', 'cols', 'max_score', 'bytes_table')
+
+    def __init__(self, typo_table):
+        if isinstance(typo_table, TypoTable):
+            typo_table = typo_table.rows
+        # The version of the table for byte strings, made when first needed.
+        self.bytes_table = None
+
+        rows = {}
+        if hasattr(typo_table, 'items'):
+            for row, typo_row in typo_table.items():
+                if typo_row:
+                    rows[row] = dict(typo_row)
+        else:
+            for code, weights in enumerate(typo_table):
+                typo_row = dict((chr(col), weight)
+                                for col, weight in enumerate(weights) if weight)
+                if typo_row:
+                    rows[chr(code)] = typo_row
+
+        self.rows = rows
+        self.cols = frozenset(col for typo_row in rows.values()
+                                                        for col in typo_row)
+        self.max_score = max([max(typo_row.values())
+                                        for typo_row in rows.values()] or [0])
+
+    # Enough of the dictionary interface for count_typos() and friends.
+    def __contains__(self, char):
+        return char in self.rows
+
+    def __getitem__(self, char):
+        return self.rows[char]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, char, default=None):
+        return self.rows.get(char, default)
+
+    def __getstate__(self):
+        return self.rows
+
+    def __setstate__(self, rows):
+        self.__init__(rows)
+
+def compile_typo_table(typo_table):
+    """Compile 'typo_table' (a dictionary of dictionaries, or a list of lists
+    indexed by character code) into a TypoTable, ready for fast lookups."""
+    return TypoTable(typo_table)
+
+def bytes_typo_table(typo_table):
+    """
+    Return the version of 'typo_table' to use with byte strings (or other
+    sequences of codes).
+
+    Bytes are ints, so the table is keyed by the codes of its chars instead.
+    The table is compiled, if it isn't already, and the result kept with the
+    TypoTable for next time - so compile your own tables if you're going to
+    use them with bytes."""
+    if typo_table is None:
+        return None
+    if not isinstance(typo_table, TypoTable):
+        typo_table = TypoTable(typo_table)
+    if typo_table.bytes_table is None and all(isinstance(row, int)
+                                                  for row in typo_table.rows):
+        # Already keyed by code (as a bytes table is, once it's been pickled
+        # or compiled again), so it's its own version for bytes.
+        typo_table.bytes_table = typo_table
+    if typo_table.bytes_table is None:
+        rows = {}
+        for row, typo_row in typo_table.rows.items():
+            if len(row) != 1: continue
+            typo_row = dict((ord(col), weight)
+                            for col, weight in typo_row.items() if len(col) == 1)
+            if typo_row:
+                rows[ord(row)] = typo_row
+        bytes_table = TypoTable(rows)
+        # Already keyed by code, so it's its own version for bytes.
+        bytes_table.bytes_table = bytes_table
+        typo_table.bytes_table = bytes_table
+    return typo_table.bytes_table
+
 adjwt = create_typo_table(__sp_table)
+adjwt_compiled = compile_typo_table(adjwt)
 
 if __name__ == '__main__':
     print_typo_table(adjwt)
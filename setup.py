@@ -8,8 +8,6 @@ HERE = pathlib.Path(__file__).parent
 # The text of the README file
 README = (HERE / 'README.md').read_text()
 
-# TODO: Package / expose functionality on the command line, too.
-
 setup(
     name='jaro_winkler',
     version='2.0.3',
@@ -21,6 +19,9 @@ setup(
     url='https://github.com/richmilne/JaroWinkler.git',
     packages=find_packages(),
     include_package_data=True,   # Include files given in MANIFEST.in
+    entry_points={
+        'console_scripts': ['jaro-winkler = jaro.cli:main'],
+    },
     platforms=['any'],
     license='GNU General Public License v3 (GPLv3)',
     classifiers=[